@@ -0,0 +1,122 @@
+"""
+Delay alert generation, done in a fixed number of queries however many flights are tracked.
+
+evaluate_delay_alerts() runs when a flight is tracked (views.TrackedFlightView) and
+for everyone from `manage.py evaluate_alerts --loop`, which entrypoint.sh keeps running
+(every ALERT_EVALUATE_INTERVAL seconds). GET /api/alerts/new/ only reads, and new alerts
+are also pushed to the user's /api/events/ streams.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import caching, events, mailer
+from .email_templates import get_delay_alert_template
+from .models import Alert, TrackedFlight, UserProfile
+
+# Flights delayed by more than this get an alert, at most one per flight per window
+DELAY_ALERT_MINUTES = 15
+REALERT_AFTER = timedelta(hours=24)
+
+
+def delayed_flights_to_alert(users=None, now=None):
+    """Delayed flights of users with delay alerts on that had no delay alert within REALERT_AFTER."""
+    now = now or timezone.now()
+    recent_alert = Alert.objects.filter(
+        user=OuterRef('user'),
+        flightNumber=OuterRef('flight_number'),
+        type='delay',
+        timestamp__gte=now - REALERT_AFTER,
+    )
+    # Users without a profile row get the profile defaults (LEFT JOIN + Coalesce), like the old loop did
+    flights = TrackedFlight.objects.annotate(
+        delay_alerts=Coalesce('user__profile__delayAlerts', Value(_profile_default('delayAlerts'))),
+        email_notifications=Coalesce('user__profile__emailNotifications',
+                                     Value(_profile_default('emailNotifications'))),
+    ).filter(
+        estimatedDelay__gt=DELAY_ALERT_MINUTES,
+        delay_alerts=True,
+    ).filter(~Exists(recent_alert))
+    if users is not None:
+        flights = flights.filter(user__in=users)
+    return flights.values(
+        'user_id', 'flight_number', 'destination', 'estimatedDelay',
+        'user__username', 'user__email', 'email_notifications',
+    ).order_by('user_id', 'flight_number', '-estimatedDelay')
+
+
+def _profile_default(field):
+    return UserProfile._meta.get_field(field).default
+
+
+def evaluate_delay_alerts(users=None, now=None):
+    """Creates the missing delay alerts (and queues their emails). Returns the new Alerts."""
+    rows = []
+    seen = set()
+    for row in delayed_flights_to_alert(users, now):
+        # The same flight number tracked twice only gets one alert (the longest delay)
+        if (row['user_id'], row['flight_number']) not in seen:
+            seen.add((row['user_id'], row['flight_number']))
+            rows.append(row)
+    if not rows:
+        return []
+
+    alerts = Alert.objects.bulk_create([
+        Alert(
+            user_id=row['user_id'],
+            title=f"Flight {row['flight_number']} Delayed",
+            message=f"Your flight to {row['destination']} is delayed by {row['estimatedDelay']} minutes.",
+            type='delay',
+            severity='high',
+            flightNumber=row['flight_number'],
+        )
+        for row in rows
+    ])
+    if any(alert.pk is None for alert in alerts):
+        _fill_in_ids(alerts)
+
+    # bulk_create sends no post_save, drop the users' cached dashboard stats here
+    for user_id in {row['user_id'] for row in rows}:
+        caching.invalidate('flight_stats', scope=user_id)
+
+    # Open /api/events/ streams get them right away
+    for alert in alerts:
+        events.publish_to_user(alert.user_id, 'alert', events.alert_event_data(alert), event_id=alert.id)
+
+    mailer.enqueue(
+        delay_alert_email(row) for row in rows
+        if row['email_notifications'] and row['user__email']
+    )
+    return alerts
+
+
+def _fill_in_ids(alerts):
+    """
+    MySQL's bulk INSERT doesn't return the new ids, the events need them (payload and
+    Last-Event-ID replay). One query reads them back: a user has at most one delay alert
+    per flight inside REALERT_AFTER, so (user, flight) from this batch's timestamp on is the row.
+    """
+    created = {}
+    for alert_id, user_id, flight_number in (
+            Alert.objects.filter(type='delay', user_id__in={a.user_id for a in alerts},
+                                 flightNumber__in={a.flightNumber for a in alerts},
+                                 timestamp__gte=min(a.timestamp for a in alerts))
+            .order_by('id').values_list('id', 'user_id', 'flightNumber')):
+        created[user_id, flight_number] = alert_id
+    for alert in alerts:
+        alert.pk = created.get((alert.user_id, alert.flightNumber))
+
+
+def delay_alert_email(row):
+    username, flight_number = row['user__username'], row['flight_number']
+    destination, delay = row['destination'], row['estimatedDelay']
+    return mailer.build_message(
+        to=row['user__email'],
+        subject=f"⚠️ Flight Delay Alert: {flight_number}",
+        body=(f"Dear {username},\n\nYour flight {flight_number} to {destination} is currently delayed by "
+              f"{delay} minutes.\n\nPlease check the dashboard for more details.\n\nSafe travels,\nNeuraSky Team"),
+        html=get_delay_alert_template(username=username, flight_number=flight_number,
+                                      destination=destination, delay_minutes=delay),
+    )
@@ -0,0 +1,127 @@
+"""
+Two-tier response cache shared by the gunicorn workers.
+
+    L1 - CACHES['local'], a LocMemCache inside each worker, only kept for a few seconds
+    L2 - CACHES['default'], shared by every worker (Redis when CACHE_REDIS_URL is set,
+         a file-based cache otherwise, LocMemCache in the tests)
+
+Every policy in API_CACHE_TTLS has a generation token stored in L2 and part of every key.
+invalidate() replaces the token, so all workers stop seeing the old entries at once
+without anyone having to find and delete them. Models fire it from signals (models.py).
+
+A missing key is computed by one worker only: it takes a short lock with cache.add(),
+the others poll L2 for the result and only compute it themselves if the lock holder
+takes longer than API_CACHE_COALESCE_WAIT.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Seconds each policy's entries live in L2 (0 turns the policy off)
+DEFAULT_TTLS = {
+    'model_info': 60,
+    'route_forecast': 60,
+    'analytics': 600,
+    'tracked_flights': 300,
+    'flight_stats': 300,
+}
+# L1 entries never live longer than this, it bounds how stale another worker's L1 can be
+L1_MAX_TTL = 5
+
+_counts_lock = threading.Lock()
+COUNTS = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'coalesced': 0}
+
+
+def _count(key):
+    with _counts_lock:
+        COUNTS[key] += 1
+
+
+def ttl_for(policy):
+    return getattr(settings, 'API_CACHE_TTLS', {}).get(policy, DEFAULT_TTLS.get(policy, 0))
+
+
+def _generation(policy, scope):
+    shared = caches['default']
+    key = f'gen:{policy}:{scope}'
+    generation = shared.get(key)
+    if generation is None:
+        shared.add(key, uuid.uuid4().hex[:12], timeout=None)
+        generation = shared.get(key)
+    return generation
+
+
+def make_key(policy, parts, scope=None):
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{policy}:{scope}:{_generation(policy, scope)}:{digest}'
+
+
+def cached(policy, parts, compute, scope=None, should_cache=None):
+    """
+    The cached value for `parts` (anything JSON-serialisable) under `policy`, computing
+    and storing it with compute() when missing. Values must be picklable.
+    `scope` (e.g. a user id) gets its own generation, see invalidate().
+    Fresh values for which should_cache(value) is false are returned but not stored.
+    """
+    ttl = ttl_for(policy)
+    if not ttl:
+        return compute()
+
+    local, shared = caches['local'], caches['default']
+    key = make_key(policy, parts, scope)
+
+    value = local.get(key)
+    if value is not None:
+        _count('l1_hits')
+        return value
+    value = shared.get(key)
+    if value is not None:
+        _count('l2_hits')
+        local.set(key, value, timeout=min(ttl, L1_MAX_TTL))
+        return value
+
+    lock_key = f'lock:{key}'
+    wait = getattr(settings, 'API_CACHE_COALESCE_WAIT', 5)
+    token = uuid.uuid4().hex
+    owner = shared.add(lock_key, token, timeout=wait)
+    if not owner:
+        # Someone else is computing it, wait for their result
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.025)
+            value = shared.get(key)
+            if value is not None:
+                _count('coalesced')
+                local.set(key, value, timeout=min(ttl, L1_MAX_TTL))
+                return value
+
+    _count('misses')
+    try:
+        value = compute()
+        if should_cache is None or should_cache(value):
+            shared.set(key, value, timeout=ttl)
+            local.set(key, value, timeout=min(ttl, L1_MAX_TTL))
+    finally:
+        # Only our own lock: a waiter that gave up never had it, and a compute() slower than
+        # `wait` has lost it to whoever took it next, whose waiters must keep coalescing
+        if owner and shared.get(lock_key) == token:
+            shared.delete(lock_key)
+    return value
+
+
+def invalidate(policy, scope=None):
+    """Drops every cached entry of `policy` under `scope`, in all workers."""
+    caches['default'].set(f'gen:{policy}:{scope}', uuid.uuid4().hex[:12], timeout=None)
+
+
+def stats():
+    with _counts_lock:
+        counts = dict(COUNTS)
+    lookups = sum(counts.values())
+    counts['hit_rate'] = round((lookups - counts['misses']) / lookups, 4) if lookups else None
+    return counts
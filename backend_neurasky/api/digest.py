@@ -0,0 +1,123 @@
+"""
+Weekly digest emails (`manage.py send_weekly_digest`, run weekly from cron).
+
+Opted-in users are read in id order, `chunk_size` at a time. Each chunk costs three
+queries: the users, then their upcoming flights and last week's alerts via
+prefetch_related. The HTML is rendered in this process, or in a process pool with
+workers > 1 (only worth it for big runs, forking costs more than a few chunks take to
+render). The messages go into the mail queue (api/mailer.py), whose worker sends them
+over one SMTP connection per batch.
+
+Every chunk's emails and the JobCheckpoint for the week are written in one transaction.
+A run that dies halfway resumes after the last user it queued, and nobody gets the same
+week's digest twice.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+
+from . import mailer
+from .email_templates import get_weekly_digest_template
+from .models import Alert, JobCheckpoint, TrackedFlight
+
+DIGEST_WINDOW = timedelta(days=7)
+MAX_ALERTS = 10
+
+
+def checkpoint_name(now):
+    year, week, _ = timezone.localtime(now).isocalendar()
+    return f'weekly_digest:{year}-W{week:02d}'
+
+
+def digest_users(after_id, limit, now):
+    """The next `limit` opted-in users after `after_id`, with their digest data prefetched."""
+    flights = (TrackedFlight.objects
+               .filter(departureTime__gte=now, departureTime__lt=now + DIGEST_WINDOW)
+               .only('user_id', 'flight_number', 'origin', 'destination', 'departureTime', 'risk_level')
+               .order_by('departureTime'))
+    alerts = (Alert.objects.filter(timestamp__gte=now - DIGEST_WINDOW)
+              .only('user_id', 'title', 'message', 'timestamp'))
+    return list(
+        User.objects.filter(profile__weeklyDigest=True, id__gt=after_id)
+        .exclude(email='')
+        .only('id', 'username', 'email')
+        .order_by('id')
+        .prefetch_related(Prefetch('tracked_flights', queryset=flights, to_attr='digest_flights'),
+                          Prefetch('alerts', queryset=alerts, to_attr='digest_alerts'))[:limit]
+    )
+
+
+def digest_payload(user, week_label):
+    """Plain data for render_digest(), so it can be pickled to the pool."""
+    return {
+        'username': user.username,
+        'email': user.email,
+        'week_label': week_label,
+        'flights': [{
+            'flight_number': f.flight_number,
+            'origin': f.origin,
+            'destination': f.destination,
+            'departure': timezone.localtime(f.departureTime).strftime('%a %d %b, %H:%M'),
+            'risk_level': f.risk_level,
+        } for f in user.digest_flights],
+        # Only the latest MAX_ALERTS are listed, the count is all of them
+        'alerts': [{'title': a.title, 'message': a.message} for a in user.digest_alerts[:MAX_ALERTS]],
+        'alert_count': len(user.digest_alerts),
+    }
+
+
+def render_digest(payload):
+    """Runs in the pool. Returns (to, subject, text body, html)."""
+    flights, alerts = payload['flights'], payload['alerts']
+    lines = [f"- {f['flight_number']} {f['origin']} -> {f['destination']}, {f['departure']}, "
+             f"{f['risk_level'] or 'unknown'} delay risk" for f in flights]
+    body = (f"Dear {payload['username']},\n\nYour flights for the coming week:\n"
+            + ("\n".join(lines) or "No upcoming flights tracked.")
+            + f"\n\nYou had {payload['alert_count']} alert(s) this week.\n\nSafe travels,\nNeuraSky Team")
+    html = get_weekly_digest_template(payload['username'], flights, alerts, payload['week_label'],
+                                      alert_count=payload['alert_count'])
+    return payload['email'], f"✈️ Your NeuraSky week ahead ({payload['week_label']})", body, html
+
+
+def run_weekly_digest(now=None, chunk_size=500, workers=1):
+    """Queues this week's digests, resuming an earlier run. Returns counts."""
+    now = now or timezone.now()
+    name = checkpoint_name(now)
+    week_label = name.split(':', 1)[1]
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=name)
+    counts = {'queued': 0, 'skipped': 0, 'resumed_after': checkpoint.last_id, 'already_done': bool(checkpoint.finished_at)}
+    if checkpoint.finished_at:
+        return counts
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    render = executor.map if executor else map
+    try:
+        last_id = checkpoint.last_id
+        while True:
+            users = digest_users(last_id, chunk_size, now)
+            if not users:
+                break
+            # Nothing to say to users without flights or alerts this week
+            payloads = [digest_payload(u, week_label) for u in users if u.digest_flights or u.digest_alerts]
+            messages = [mailer.build_message(to, subject, body, html=html)
+                        for to, subject, body, html in render(render_digest, payloads)]
+            last_id = users[-1].id
+            with transaction.atomic():
+                mailer.enqueue(messages)
+                JobCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                    last_id=last_id, processed=F('processed') + len(users), updated_at=timezone.now())
+            counts['queued'] += len(messages)
+            counts['skipped'] += len(users) - len(messages)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    JobCheckpoint.objects.filter(pk=checkpoint.pk).update(finished_at=timezone.now())
+    return counts
@@ -86,3 +86,85 @@ def get_delay_alert_template(username, flight_number, destination, delay_minutes
 </body>
 </html>
     """
+
+def get_weekly_digest_template(username, flights, alerts, week_label, dashboard_url="https://neurasky.click/dashboard",
+                               alert_count=None):
+    """
+    Returns the HTML weekly digest: the user's upcoming flights and last week's alerts.
+    `flights` and `alerts` are lists of plain dicts (see api/digest.py), `alert_count` is
+    the week's total when `alerts` only has the latest few.
+    """
+    risk_colors = {'High': '#ef4444', 'Medium': '#f59e0b', 'Low': '#10b981'}
+    flight_rows = "".join(f"""
+                        <tr>
+                            <td style="padding: 8px 0; font-weight: bold; color: #0f172a;">{f['flight_number']}</td>
+                            <td style="padding: 8px 0; color: #475569;">{f['origin'] or '-'} &rarr; {f['destination'] or '-'}</td>
+                            <td style="padding: 8px 0; color: #475569;">{f['departure'] or 'TBA'}</td>
+                            <td style="padding: 8px 0; font-weight: bold; text-align: right; color: {risk_colors.get(f['risk_level'], '#64748b')};">{f['risk_level'] or 'N/A'}</td>
+                        </tr>""" for f in flights) or """
+                        <tr><td colspan="4" style="padding: 8px 0; color: #64748b;">No upcoming flights tracked.</td></tr>"""
+    alert_rows = "".join(f"""
+                    <li style="margin-bottom: 6px;">{a['title']}: {a['message']}</li>""" for a in alerts) or """
+                    <li>No alerts this week.</li>"""
+    if alert_count and alert_count > len(alerts):
+        alert_rows += f"""
+                    <li style="color: #64748b;">...and {alert_count - len(alerts)} more</li>"""
+
+    return f"""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Your Weekly Flight Digest</title>
+</head>
+<body style="margin: 0; padding: 0; font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f7fa;">
+    <table role="presentation" border="0" cellpadding="0" cellspacing="0" width="100%" style="max-width: 600px; margin: 0 auto; background-color: #ffffff; border-radius: 8px; overflow: hidden; box-shadow: 0 4px 6px rgba(0,0,0,0.1); margin-top: 20px; margin-bottom: 20px;">
+        <!-- Header -->
+        <tr>
+            <td style="background-color: #1e3a8a; padding: 24px; text-align: center;">
+                <h1 style="color: #ffffff; margin: 0; font-size: 24px; letter-spacing: 1px;">NEURASKY</h1>
+                <p style="color: #93c5fd; margin: 5px 0 0 0; font-size: 14px; text-transform: uppercase; letter-spacing: 2px;">Weekly Digest &middot; {week_label}</p>
+            </td>
+        </tr>
+
+        <!-- Body -->
+        <tr>
+            <td style="padding: 32px 24px;">
+                <p style="color: #334155; font-size: 16px; margin-bottom: 24px;">Dear <strong>{username}</strong>,</p>
+
+                <p style="color: #475569; font-size: 16px; line-height: 1.5; margin-bottom: 16px;">Here are your upcoming flights and their predicted delay risk:</p>
+
+                <!-- Flights -->
+                <div style="background-color: #f8fafc; border: 1px solid #e2e8f0; border-radius: 6px; padding: 16px 20px; margin-bottom: 24px;">
+                    <table width="100%" border="0" style="font-size: 14px;">{flight_rows}
+                    </table>
+                </div>
+
+                <p style="color: #475569; font-size: 16px; line-height: 1.5; margin-bottom: 8px;">Alerts from the past week:</p>
+                <ul style="color: #475569; font-size: 14px; line-height: 1.5; margin-bottom: 32px;">{alert_rows}
+                </ul>
+
+                <!-- CTA Button -->
+                <div style="text-align: center; margin-bottom: 24px;">
+                    <a href="{dashboard_url}" style="background-color: #2563eb; color: #ffffff; padding: 12px 32px; border-radius: 6px; text-decoration: none; font-weight: bold; font-size: 16px; display: inline-block;">View Dashboard</a>
+                </div>
+            </td>
+        </tr>
+
+        <!-- Footer -->
+        <tr>
+            <td style="background-color: #f1f5f9; padding: 24px; text-align: center; border-top: 1px solid #e2e8f0;">
+                <p style="color: #64748b; font-size: 12px; margin-bottom: 8px;">
+                    &copy; {datetime.now().year} NeuraSky. All rights reserved.
+                </p>
+                <p style="color: #94a3b8; font-size: 11px; margin: 0;">
+                    You received this email because you subscribed to the weekly digest in your account settings.<br>
+                    <a href="{dashboard_url}/settings" style="color: #64748b; text-decoration: underline;">Manage Preferences</a>
+                </p>
+            </td>
+        </tr>
+    </table>
+</body>
+</html>
+    """
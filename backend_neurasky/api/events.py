@@ -0,0 +1,179 @@
+"""
+Pub/sub behind the /api/events/ stream (api/streams.py).
+
+Each user has a channel ('user:<id>'). Alert generation and tracked flight changes
+publish to it, and every open stream of that user gets the event. An idle stream is
+an asyncio queue waiting, it costs no queries and no CPU until something is published.
+
+Backends (EVENTS_BACKEND):
+    'local' - in this process only. Enough when the streams are served by the same
+              process that publishes (runserver, tests, a single ASGI process)
+    'redis' - publishes through Redis (EVENTS_REDIS_URL, or CACHE_REDIS_URL) so events
+              from gunicorn workers and cron jobs reach the ASGI process holding the
+              streams. Needs the redis package
+"""
+import asyncio
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+# Events a slow client can fall behind by before it's told to resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """One open stream. Must be created inside the event loop that reads it."""
+
+    def __init__(self, channel, max_queue=SUBSCRIBER_QUEUE_SIZE):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_queue)
+        self.overflowed = False
+
+    def _deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Drop it and tell the client to refetch (see api/streams.py)
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """The next event, or None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self.counts = {'published': 0, 'delivered': 0}
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event):
+        """Thread-safe, callable from sync code in any thread."""
+        self._fan_out(channel, event)
+
+    def _fan_out(self, channel, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+            self.counts['published'] += 1
+            self.counts['delivered'] += len(subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # Its loop is gone (server shutting down)
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, channels=len(self._channels),
+                        subscribers=sum(len(s) for s in self._channels.values()))
+
+    def _after_fork(self):
+        # Streams belong to the parent's event loop
+        self._lock = threading.Lock()
+        self._channels = {}
+
+
+class RedisBroker(LocalBroker):
+    """LocalBroker fed from Redis pub/sub. The listener thread starts with the first subscriber."""
+    PREFIX = 'neurasky:events:'
+
+    def __init__(self, url):
+        super().__init__()
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self._listener = None
+
+    def publish(self, channel, event):
+        with self._lock:
+            self.counts['published'] += 1
+        self.redis.publish(self.PREFIX + channel, json.dumps(event, default=str))
+
+    def subscribe(self, channel):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name='events-redis', daemon=True)
+                self._listener.start()
+        return super().subscribe(channel)
+
+    def _listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(self.PREFIX + '*')
+        for message in pubsub.listen():
+            channel = message['channel'].decode()[len(self.PREFIX):]
+            self._fan_out(channel, json.loads(message['data']))
+
+    def _after_fork(self):
+        super()._after_fork()
+        self._listener = None
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            if getattr(settings, 'EVENTS_BACKEND', 'local') == 'redis':
+                _broker = RedisBroker(settings.EVENTS_REDIS_URL)
+            else:
+                _broker = LocalBroker()
+        return _broker
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: _broker and _broker._after_fork())
+
+
+def alert_event_data(alert):
+    return {
+        'id': alert.id,
+        'title': alert.title,
+        'message': alert.message,
+        'read': alert.read,
+        'timestamp': alert.timestamp.isoformat() if alert.timestamp else None,
+        'type': alert.type,
+        'severity': alert.severity,
+        'flightNumber': alert.flightNumber,
+    }
+
+
+def publish_to_user(user_id, kind, data, event_id=None):
+    """Publishes once the current transaction commits, so listeners never see rolled back rows."""
+    event = {'type': kind, 'id': event_id, 'data': data}
+
+    def send():
+        try:
+            get_broker().publish(user_channel(user_id), event)
+        except Exception as e:
+            # Streams are a nicety, never fail the request over them
+            print(f"⚠️ Could not publish {kind} event for user {user_id}: {e}")
+
+    transaction.on_commit(send)
@@ -0,0 +1,207 @@
+"""
+Streaming exports of FlightHistory and a user's tracked flights, as CSV (gzipped on the fly)
+or Parquet. Used by the /api/exports/ views and `manage.py export_flights`.
+
+Rows are read `chunk_size` at a time by primary key (`pk > last` slices of values_list()).
+Each chunk is its own short query, and memory stays bounded on MySQL too, where
+.iterator() gets the whole result set buffered by the driver anyway. Every chunk becomes
+one piece of output (a block of CSV lines, or one Parquet row group) before the next is read.
+
+A multi-minute download still has to outlive the server's timeouts. Serve /api/exports/
+from the ASGI app (same port as /api/events/, see entrypoint.sh) or run gunicorn with
+GUNICORN_THREADS > 1. Sync workers only check in with the master between requests and are
+killed after GUNICORN_TIMEOUT.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import FlightHistory, TrackedFlight
+
+FLIGHT_HISTORY_COLUMNS = ['id', 'flight_number', 'airline', 'status', 'delay_minutes', 'recorded_at']
+TRACKED_FLIGHT_COLUMNS = [
+    'id', 'flight_number', 'airline', 'date', 'origin', 'destination', 'status', 'estimatedDelay',
+    'departureTime', 'arrivalTime', 'gate', 'terminal', 'risk_level', 'risk_probability',
+]
+FORMATS = ('csv', 'parquet')
+
+
+class ExportError(ValueError):
+    """Bad filters or format."""
+
+
+def flight_history(start=None, end=None, airlines=None):
+    """(queryset, columns) of FlightHistory recorded between the start and end dates (inclusive)."""
+    queryset = FlightHistory.objects.all()
+    queryset = _date_range(queryset, 'recorded_at', start, end)
+    if airlines:
+        queryset = queryset.filter(airline__in=airlines)
+    return queryset, FLIGHT_HISTORY_COLUMNS
+
+
+def tracked_flights(user, start=None, end=None, airlines=None):
+    """
+    (queryset, columns) of the user's tracked flights departing between start and end.
+    Airlines can be codes (MH) or names, tracked flights store the name.
+    """
+    queryset = _date_range(TrackedFlight.objects.filter(user=user), 'departureTime', start, end)
+    if airlines:
+        queryset = queryset.filter(airline__in=[TrackedFlight.AIRLINES.get(a.upper(), a) for a in airlines])
+    return queryset, TRACKED_FLIGHT_COLUMNS
+
+
+# What can be exported, by name (also the download's file name), each called as
+# (user, start, end, airlines) -> (queryset, columns)
+DATASETS = {
+    'flight_history': lambda user, start, end, airlines: flight_history(start, end, airlines),
+    'tracked_flights': tracked_flights,
+}
+
+
+def _date_range(queryset, field, start, end):
+    # Whole local days, like the analytics
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': timezone.make_aware(datetime.combine(start, time.min))})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))})
+    return queryset
+
+
+def row_chunks(queryset, columns, chunk_size=None, counts=None):
+    """Lists of value tuples, `chunk_size` rows each, in pk order. Adds up counts['rows'] if given."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    queryset = queryset.order_by('pk').values_list('pk', *columns)
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1][0]
+        if counts is not None:
+            counts['rows'] = counts.get('rows', 0) + len(chunk)
+        yield [row[1:] for row in chunk]
+        if len(chunk) < chunk_size:
+            return
+
+
+def csv_stream(chunks, columns):
+    """CSV bytes, one block per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_stream(pieces, level=6):
+    """Gzips a byte stream as it goes, a valid .gz however it's cut into pieces."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for piece in pieces:
+        data = compressor.compress(piece)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _Sink:
+    """Write-only file for ParquetWriter that hands back whatever was written since last time."""
+
+    def __init__(self):
+        self.parts, self.position, self.closed = [], 0, False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def parquet_schema(model, columns):
+    import pyarrow as pa
+    types = {
+        'AutoField': pa.int64(), 'BigAutoField': pa.int64(), 'IntegerField': pa.int64(),
+        'PositiveIntegerField': pa.int64(), 'FloatField': pa.float64(), 'BooleanField': pa.bool_(),
+        'DateField': pa.date32(), 'DateTimeField': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(name, types.get(model._meta.get_field(name).get_internal_type(), pa.string()))
+                      for name in columns])
+
+
+def parquet_stream(chunks, model, columns):
+    """Parquet bytes, one row group per chunk (snappy compressed, so no gzip on top)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        # Raised here rather than on the first read, before a response has started
+        raise ExportError('Parquet exports need pyarrow (pip install pyarrow)') from e
+
+    schema = parquet_schema(model, columns)
+
+    def pieces():
+        sink = _Sink()
+        writer = pq.ParquetWriter(sink, schema, compression='snappy')
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pydict(
+                {name: [row[i] for row in chunk] for i, name in enumerate(columns)}, schema=schema))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    return pieces()
+
+
+def export_stream(queryset, columns, export_format='csv', gzip=True, chunk_size=None, counts=None):
+    """The export as an iterator of bytes."""
+    if export_format not in FORMATS:
+        raise ExportError(f"format must be one of {', '.join(FORMATS)}")
+    chunks = row_chunks(queryset, columns, chunk_size, counts)
+    if export_format == 'parquet':
+        return parquet_stream(chunks, queryset.model, columns)
+    stream = csv_stream(chunks, columns)
+    return gzip_stream(stream) if gzip else stream
+
+
+def filename(name, export_format, gzip):
+    if export_format == 'parquet':
+        return f'{name}.parquet'
+    return f'{name}.csv.gz' if gzip else f'{name}.csv'
+
+
+def content_type(export_format, gzip):
+    if export_format == 'parquet':
+        return 'application/vnd.apache.parquet'
+    return 'application/gzip' if gzip else 'text/csv'
+
+
+async def aiterate(iterator):
+    """
+    A sync iterator as an async one, each step in the sync thread. An ASGI server has to be
+    handed one of these, a sync iterator would be read into a list first.
+    """
+    iterator = iter(iterator)
+    step = sync_to_async(next)
+    done = object()
+    while (item := await step(iterator, done)) is not done:
+        yield item
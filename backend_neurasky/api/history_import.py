@@ -0,0 +1,207 @@
+"""
+Bulk load of BTS-style flight files (what generate_dataset.py / generate_enhanced_dataset.py
+write, or the real BTS on-time CSVs) into FlightHistory, `manage.py import_flight_history`.
+
+The file is read `chunk_size` rows at a time and only the columns below, with pandas for
+CSV (.csv.gz too) and pyarrow for Parquet (optional, pip install pyarrow), so memory stays
+flat however big the file is. Each chunk is one transaction:
+    - rows whose import_key is already in the table are dropped (reruns, overlapping files)
+    - bulk_create the rest
+    - rollups.apply() them, the analytics stay in step
+    - move the file's JobCheckpoint to the number of source rows read
+An interrupted import resumes from the checkpoint, a finished one isn't read again unless
+restart=True.
+
+    FlightDate + CRSDepTime              -> recorded_at (local time)
+    IATA_Code_Operating_Airline          -> airline
+      + Flight_Number_Operating_Airline  -> flight_number
+    Cancelled, DepDelayMinutes           -> status ('Cancelled', 'Delayed', 'On Time'), delay_minutes
+"""
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import caching, rollups
+from .models import FlightHistory, JobCheckpoint
+
+COLUMNS = ['FlightDate', 'IATA_Code_Operating_Airline', 'Flight_Number_Operating_Airline',
+           'Origin', 'Dest', 'CRSDepTime', 'DepDelayMinutes', 'Cancelled']
+REQUIRED = ['FlightDate', 'IATA_Code_Operating_Airline', 'DepDelayMinutes']
+# BTS counts a departure as delayed from 15 minutes (DepDel15)
+DELAYED_FROM_MINUTES = 15
+KEY_LOOKUP_BATCH = 1000
+
+
+class ImportFileError(ValueError):
+    """The file can't be read or doesn't have the BTS columns."""
+
+
+def checkpoint_name(path):
+    # The size is in the name so a regenerated file starts over
+    return f'import_flight_history:{os.path.basename(path)[:60]}:{os.path.getsize(path)}'
+
+
+def is_parquet(path):
+    return path.lower().endswith(('.parquet', '.pq'))
+
+
+def read_chunks(path, chunk_size, skip_rows=0):
+    """DataFrames of at most chunk_size source rows with the COLUMNS the file has, after skip_rows."""
+    if is_parquet(path):
+        yield from _parquet_chunks(path, chunk_size, skip_rows)
+        return
+
+    header = list(pd.read_csv(path, nrows=0).columns)
+    _check_columns(path, header)
+    yield from pd.read_csv(
+        path, usecols=[c for c in COLUMNS if c in header], chunksize=chunk_size,
+        skiprows=range(1, skip_rows + 1),
+        dtype={'FlightDate': str, 'IATA_Code_Operating_Airline': str, 'Origin': str, 'Dest': str},
+    )
+
+
+def _parquet_chunks(path, chunk_size, skip_rows):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportFileError('Reading Parquet needs pyarrow (pip install pyarrow)') from e
+
+    parquet = pq.ParquetFile(path)
+    _check_columns(path, parquet.schema_arrow.names)
+    columns = [c for c in COLUMNS if c in parquet.schema_arrow.names]
+    # Whole row groups before the checkpoint aren't read at all
+    groups, skipped = [], 0
+    for i in range(parquet.num_row_groups):
+        rows = parquet.metadata.row_group(i).num_rows
+        if skipped + rows <= skip_rows:
+            skipped += rows
+        else:
+            groups.append(i)
+    for batch in parquet.iter_batches(batch_size=chunk_size, row_groups=groups, columns=columns):
+        frame = batch.to_pandas()
+        if skipped < skip_rows:
+            drop = min(len(frame), skip_rows - skipped)
+            frame, skipped = frame.iloc[drop:], skipped + drop
+        if len(frame):
+            yield frame
+
+
+def _check_columns(path, columns):
+    missing = [c for c in REQUIRED if c not in columns]
+    if missing:
+        raise ImportFileError(f"{path} has no {', '.join(missing)} column, is it a BTS-style file?")
+
+
+def _present(value):
+    # None, NaN (value != value) and '' all mean missing
+    return value is not None and value == value and value != ''
+
+
+def _truthy(value):
+    return _present(value) and str(value).strip().lower() in ('1', '1.0', 'true', 't', 'yes')
+
+
+def histories_from_frame(frame):
+    """(FlightHistory objects with import_key set, number of unusable rows) for one chunk."""
+    n = len(frame)
+
+    def column(name):
+        return frame[name].tolist() if name in frame else [None] * n
+
+    histories, invalid = [], 0
+    midnights = {}
+    for flight_date, airline, number, origin, dest, crs_time, delay, cancelled in zip(
+            *(column(name) for name in COLUMNS)):
+        if not _present(flight_date) or not _present(airline):
+            invalid += 1
+            continue
+        flight_date = str(flight_date)[:10]
+        midnight = midnights.get(flight_date)
+        if midnight is None:
+            try:
+                midnight = timezone.make_aware(datetime.strptime(flight_date, '%Y-%m-%d'))
+            except ValueError:
+                invalid += 1
+                continue
+            midnights[flight_date] = midnight
+
+        crs_time = int(crs_time) if _present(crs_time) else 0  # hhmm
+        number = int(number) if _present(number) else ''
+        cancelled = _truthy(cancelled)
+        delay = 0 if cancelled or not _present(delay) else max(int(delay), 0)
+        if cancelled:
+            status = 'Cancelled'
+        elif delay >= DELAYED_FROM_MINUTES:
+            status = 'Delayed'
+        else:
+            status = 'On Time'
+
+        airline = str(airline).strip()
+        origin = origin if _present(origin) else ''
+        dest = dest if _present(dest) else ''
+        histories.append(FlightHistory(
+            flight_number=f'{airline}{number}'[:20],
+            airline=airline,
+            status=status,
+            delay_minutes=delay,
+            recorded_at=midnight + timedelta(minutes=crs_time // 100 * 60 + crs_time % 100),
+            import_key=f'{flight_date}|{airline}|{number}|{origin}|{dest}|{crs_time:04d}'[:64],
+        ))
+    return histories, invalid
+
+
+def drop_existing(histories):
+    """The histories whose import_key is new, both to the table and within the list."""
+    unique = {}
+    for history in histories:
+        unique.setdefault(history.import_key, history)
+    keys = list(unique)
+    for i in range(0, len(keys), KEY_LOOKUP_BATCH):
+        for key in FlightHistory.objects.filter(import_key__in=keys[i:i + KEY_LOOKUP_BATCH]).values_list('import_key', flat=True):
+            del unique[key]
+    return list(unique.values())
+
+
+def import_file(path, chunk_size=5000, batch_size=1000, restart=False, progress=None):
+    """
+    Imports one file. `progress(counts)` is called after every chunk.
+    Returns {read, imported, duplicates, invalid, resumed_after, already_done}.
+    """
+    if not os.path.exists(path):
+        raise ImportFileError(f'{path} does not exist')
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name=checkpoint_name(path))
+    if restart:
+        checkpoint.last_id, checkpoint.processed, checkpoint.finished_at = 0, 0, None
+        checkpoint.save()
+    counts = {'read': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0,
+              'resumed_after': checkpoint.last_id, 'already_done': checkpoint.finished_at is not None}
+    if counts['already_done']:
+        return counts
+
+    position = checkpoint.last_id
+    try:
+        for frame in read_chunks(path, chunk_size, skip_rows=position):
+            histories, invalid = histories_from_frame(frame)
+            position += len(frame)
+            with transaction.atomic():
+                new = drop_existing(histories)
+                FlightHistory.objects.bulk_create(new, batch_size=batch_size)
+                rollups.apply(new)
+                JobCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                    last_id=position, processed=F('processed') + len(new), updated_at=timezone.now())
+            counts['read'] += len(frame)
+            counts['imported'] += len(new)
+            counts['duplicates'] += len(histories) - len(new)
+            counts['invalid'] += invalid
+            if progress:
+                progress(counts)
+    finally:
+        if counts['imported']:
+            caching.invalidate('analytics')
+
+    JobCheckpoint.objects.filter(pk=checkpoint.pk).update(finished_at=timezone.now())
+    return counts
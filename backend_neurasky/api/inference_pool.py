@@ -0,0 +1,199 @@
+"""
+Out-of-process scoring, so CPU-heavy requests (route forecasts, big batches) run on
+their own cores instead of tying up the web workers.
+
+    InferenceServer - `manage.py run_inference_pool`: listens on a local socket and hands
+                      each request to a pool of scoring processes forked after the model
+                      is loaded. At most max_pending requests are in flight, anything past
+                      that gets an immediate 'busy' answer instead of queueing.
+    InferenceClient - used by ml_utils.score() in the web workers. Every call carries a
+                      deadline, a busy, late or unreachable pool raises PoolUnavailable
+                      and the caller falls back to a degraded answer.
+
+Messages are pickled tuples over multiprocessing.connection with an auth key, so the
+socket has to stay local (a unix socket path, or 127.0.0.1).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import Client, Listener
+
+
+class PoolUnavailable(RuntimeError):
+    """The pool couldn't answer in time. `reason` is 'busy', 'deadline', 'stale', 'unreachable' or 'error'."""
+
+    def __init__(self, reason, detail=''):
+        super().__init__(f"Inference pool {reason}{': ' + detail if detail else ''}")
+        self.reason = reason
+
+
+def parse_address(address):
+    """'host:port' -> (host, port), anything else is a unix socket path."""
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return (host, int(port))
+    return address
+
+
+class InferenceServer:
+    """
+    `job(X, contributions, version, deadline)` runs inside the pool processes and returns
+    ('ok', result), ('stale', serving_version) or ('expired', None).
+    """
+
+    def __init__(self, address, job, authkey, processes=2, max_pending=32):
+        self.address = parse_address(address)
+        self.job = job
+        self.authkey = authkey
+        self.processes = processes
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'busy': 0, 'expired': 0, 'errors': 0}
+        self._listener = None
+        self._closed = False
+
+    def start_pool(self):
+        # Fork every process now, before any connection threads exist
+        self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('fork'))
+        for future in [self.executor.submit(os.getpid) for _ in range(self.processes)]:
+            future.result()
+
+    def serve_forever(self, ready=None):
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        self.start_pool()
+        with Listener(self.address, authkey=self.authkey) as listener:
+            self._listener = listener
+            self.address = listener.address
+            if ready:
+                ready.set()
+            while not self._closed:
+                try:
+                    conn = listener.accept()
+                except (OSError, EOFError) as e:
+                    if self._closed:
+                        break
+                    # Failed handshake (wrong key, client gone), keep serving the rest
+                    print(f"⚠️ Inference pool rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        """Stops accepting connections (removing the socket file) and shuts the processes down."""
+        self._closed = True
+        if self._listener is not None:
+            self._listener.close()
+        self.executor.shutdown(cancel_futures=True)
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _handle(self, conn):
+        """One client connection, requests on it are answered in order."""
+        with conn:
+            while True:
+                try:
+                    X, contributions, version, deadline = conn.recv()
+                except (EOFError, OSError):
+                    return
+                self._count('requests')
+                reply = self._run(X, contributions, version, deadline)
+                try:
+                    conn.send(reply)
+                except OSError:
+                    # Client gave up at its deadline and dropped the connection
+                    return
+
+    def _run(self, X, contributions, version, deadline):
+        if not self._slots.acquire(blocking=False):
+            self._count('busy')
+            return ('busy', None)
+        try:
+            future = self.executor.submit(self.job, X, contributions, version, deadline)
+            reply = future.result(timeout=max(0.0, deadline - time.time()) + 1.0)
+        except Exception as e:
+            self._count('errors')
+            return ('error', str(e))
+        finally:
+            self._slots.release()
+        if reply[0] == 'expired':
+            self._count('expired')
+        return reply
+
+
+class InferenceClient:
+    """Thread-safe client, keeps idle connections around for reuse."""
+
+    def __init__(self, address, authkey):
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._idle = []
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'busy': 0, 'deadline': 0, 'stale': 0, 'unreachable': 0, 'error': 0,
+                       'reconnects': 0}
+
+    def _connection(self, fresh=False):
+        """(connection, whether it was an idle one being reused)"""
+        with self._lock:
+            if self._idle and not fresh:
+                return self._idle.pop(), True
+        return Client(self.address, authkey=self.authkey), False
+
+    def _fail(self, reason, detail=''):
+        with self._lock:
+            self.counts[reason] += 1
+        raise PoolUnavailable(reason, detail)
+
+    def score(self, X, contributions, version, timeout):
+        """score() on the pool within `timeout` seconds. Raises PoolUnavailable."""
+        with self._lock:
+            self.counts['requests'] += 1
+        deadline = time.time() + timeout
+        retried = False
+        while True:
+            conn, reused = None, False
+            try:
+                conn, reused = self._connection(fresh=retried)
+                conn.send((X, contributions, version, deadline))
+                if not conn.poll(max(0.0, deadline - time.time())):
+                    # The late answer would be read by the next request, drop the connection
+                    conn.close()
+                    self._fail('deadline')
+                status, payload = conn.recv()
+                break
+            except (OSError, EOFError) as e:
+                if conn is not None:
+                    conn.close()
+                if not reused or retried or time.time() >= deadline:
+                    self._fail('unreachable', str(e))
+                retried = True
+                # An idle connection from before a pool restart. The others are just as dead,
+                # drop them and try once more on a new one (scoring has no side effects)
+                with self._lock:
+                    stale, self._idle = self._idle, []
+                    self.counts['reconnects'] += 1
+                for idle in stale:
+                    idle.close()
+
+        with self._lock:
+            self._idle.append(conn)
+        if status == 'ok':
+            return payload
+        if status == 'expired':
+            self._fail('deadline')
+        if status == 'stale':
+            self._fail('stale', f"pool serves {payload}, this worker {version}")
+        self._fail('busy' if status == 'busy' else 'error', payload or '')
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def _after_fork(self):
+        # Sockets opened by the parent must not be shared with the child
+        self._idle = []
+        self._lock = threading.Lock()
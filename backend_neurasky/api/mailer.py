@@ -0,0 +1,163 @@
+"""
+Outgoing email, kept in the OutboundEmail table so API requests never wait on SES.
+
+    enqueue()     - stores messages with one INSERT, called from request code
+    send_queued() - one round of `manage.py send_queued_mail`: claims the due rows and
+                    sends them over a single SMTP connection, paced to MAIL_SEND_RATE
+                    (the SES sending quota, messages per second)
+
+A failed send is retried after an exponential backoff. After MAIL_MAX_ATTEMPTS, or
+straight away on a permanent (5xx) SMTP answer, the row is marked 'dead' and kept
+with its last error so it can be looked at.
+"""
+import smtplib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+# Claimed rows stay invisible to other workers this long, a crashed worker's batch comes back after it
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_BACKOFF = timedelta(hours=1)
+
+
+def build_message(to, subject, body, html=None):
+    message = EmailMultiAlternatives(subject=subject, body=body, to=[to])
+    if html:
+        message.attach_alternative(html, 'text/html')
+    return message
+
+
+def enqueue(messages):
+    """Queues EmailMessages (one row per recipient), returns how many rows were queued."""
+    rows = []
+    for message in messages:
+        html = next((content for content, mimetype in getattr(message, 'alternatives', [])
+                     if mimetype == 'text/html'), '')
+        rows.extend(OutboundEmail(to_email=to, subject=message.subject, body=message.body, html_body=html)
+                    for to in message.to)
+    if rows:
+        OutboundEmail.objects.bulk_create(rows)
+    return len(rows)
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` sends per second (bursts up to `rate`). 0 means no limit."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = min(rate, 1.0)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.sleep((1 - self.tokens) / self.rate)
+                self.updated = self.clock()
+                self.tokens = 1.0
+            self.tokens -= 1
+
+
+def backoff(attempts):
+    base = timedelta(seconds=getattr(settings, 'MAIL_RETRY_BACKOFF', 60))
+    return min(base * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def is_permanent(error):
+    """5xx answers won't get better by retrying (bad address, rejected content...)."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def claim(batch_size, now=None):
+    """Due queued rows, leased to this worker so concurrent workers skip them."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if rows:
+            OutboundEmail.objects.filter(id__in=[row.id for row in rows]).update(next_attempt_at=now + CLAIM_LEASE)
+    return rows
+
+
+def send_queued(batch_size=None, limiter=None, connection=None):
+    """Sends one batch. Returns counts of sent, retried and dead-lettered rows."""
+    batch_size = batch_size or getattr(settings, 'MAIL_BATCH_SIZE', 100)
+    limiter = limiter or RateLimiter(getattr(settings, 'MAIL_SEND_RATE', 14))
+    counts = {'sent': 0, 'retry': 0, 'dead': 0}
+    rows = claim(batch_size)
+    if not rows:
+        return counts
+
+    sent, failed, released = [], [], []
+    connection = connection or get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        failed = [(row, e) for row in rows]
+    else:
+        try:
+            for i, row in enumerate(rows):
+                limiter.wait()
+                message = build_message(row.to_email, row.subject, row.body, row.html_body)
+                try:
+                    connection.send_messages([message])
+                    sent.append(row.id)
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as e:
+                    # The server answered, the connection is still good for the others
+                    failed.append((row, e))
+                except Exception as e:
+                    # Lost the connection, the rest of the batch goes back for the next round
+                    failed.append((row, e))
+                    released = [r.id for r in rows[i + 1:]]
+                    break
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    now = timezone.now()
+    if sent:
+        OutboundEmail.objects.filter(id__in=sent).update(
+            status='sent', sent_at=now, attempts=F('attempts') + 1, last_error='')
+    if released:
+        OutboundEmail.objects.filter(id__in=released).update(next_attempt_at=now)
+    max_attempts = getattr(settings, 'MAIL_MAX_ATTEMPTS', 5)
+    for row, error in failed:
+        row.attempts += 1
+        row.last_error = f"{type(error).__name__}: {error}"[:1000]
+        if is_permanent(error) or row.attempts >= max_attempts:
+            row.status = 'dead'
+            counts['dead'] += 1
+            print(f"❌ EMAIL DEAD: {row.to_email} '{row.subject}' after {row.attempts} attempts. Error: {row.last_error}")
+        else:
+            row.next_attempt_at = now + backoff(row.attempts)
+            counts['retry'] += 1
+        row.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    counts['sent'] = len(sent)
+    return counts
+
+
+def stats():
+    counts = dict(OutboundEmail.objects.values_list('status').annotate(n=Count('id')).order_by())
+    return {status: counts.get(status, 0) for status, _ in OutboundEmail.STATUSES}
@@ -0,0 +1,116 @@
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api import ml_utils
+from api.tree_evaluator import TreeEvaluator
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks per-row prediction latency of the LightGBM model against the native tree evaluator'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', help='CSV written by generate_enhanced_dataset.py (default: synthetic rows)')
+        parser.add_argument('--rows', type=int, default=2000, help='Number of rows to score')
+        parser.add_argument('--single', type=int, default=500, help='Number of one-row calls to time per backend')
+
+    def handle(self, *args, **options):
+        bundle = ml_utils.REGISTRY.current()
+        if bundle is None:
+            raise CommandError('Model is not loaded, run the training script first')
+
+        X = self._load_rows(bundle, options['dataset'], options['rows'])
+        self.stdout.write(f"Scoring {len(X):,} rows with {bundle.feature_names}")
+
+        booster = bundle.booster
+        started = time.perf_counter()
+        evaluator = TreeEvaluator.from_booster(booster)
+        self.stdout.write(f"Evaluator build: {(time.perf_counter() - started) * 1000:.1f} ms, "
+                          f"{evaluator.num_trees} trees, {len(evaluator.feature):,} nodes, depth {evaluator.max_depth}")
+
+        # Parity
+        expected = booster.predict(X)
+        compiled = evaluator.predict_proba(X)[:, 1]
+        vectorized = 1.0 / (1.0 + np.exp(-evaluator.sigmoid * evaluator.raw_score(X)))
+        self.stdout.write(f"Max |diff| vs Booster.predict: compiled {np.abs(compiled - expected).max():.2e}, "
+                          f"vectorized {np.abs(vectorized - expected).max():.2e}")
+
+        # The sklearn wrapper is only around when the legacy joblib artifacts are
+        sklearn_model = self._sklearn_model()
+
+        # Single-row latency
+        rows = [X[i:i + 1] for i in range(min(options['single'], len(X)))]
+        self.stdout.write('\nPer-row latency (one row per call):')
+        for name, fn in [
+            ('LGBMClassifier.predict_proba', sklearn_model and (lambda row: sklearn_model.predict_proba(row))),
+            ('Booster.predict', lambda row: booster.predict(row)),
+            ('TreeEvaluator compiled', lambda row: evaluator.predict_proba_row(row[0])),
+            ('ml_utils.predict_probabilities', lambda row: ml_utils.predict_probabilities(row)),
+            ('TreeEvaluator array walk', lambda row: evaluator._walk_row(row[0].tolist())),
+        ]:
+            if fn:
+                self.stdout.write(f"  {name:<30} {self._time_per_call(fn, rows) * 1e6:9.1f} us")
+
+        # Batch throughput
+        self.stdout.write(f'\nWhole batch of {len(X):,} rows:')
+        for name, fn in [
+            ('LGBMClassifier.predict_proba', sklearn_model and (lambda: sklearn_model.predict_proba(X))),
+            ('Booster.predict', lambda: booster.predict(X)),
+            ('TreeEvaluator compiled', lambda: evaluator.predict_proba(X)),
+            ('TreeEvaluator vectorized', lambda: evaluator.raw_score(X)),
+        ]:
+            if not fn:
+                continue
+            elapsed = self._time_per_call(lambda _: fn(), [None])
+            self.stdout.write(f"  {name:<30} {elapsed * 1000:9.1f} ms  ({elapsed / len(X) * 1e6:.1f} us/row)")
+
+    def _sklearn_model(self):
+        path = os.path.join(ml_utils.artifact_dir(), ml_utils.ARTIFACT_FILES['model'])
+        if not os.path.exists(path):
+            return None
+        import joblib
+        return joblib.load(path)
+
+    def _time_per_call(self, fn, args):
+        fn(args[0])  # warm up
+        started = time.perf_counter()
+        for arg in args:
+            fn(arg)
+        return (time.perf_counter() - started) / len(args)
+
+    def _load_rows(self, bundle, dataset, limit):
+        encoder = bundle.feature_encoder
+        distance = bundle.feature_names.index('Distance')
+
+        if dataset:
+            import pandas as pd
+            df = pd.read_csv(dataset, nrows=limit)
+            airline_col = 'IATA_Code_Operating_Airline' if 'IATA_Code_Operating_Airline' in df else 'Operating_Airline'
+            rows = []
+            for record in df.itertuples(index=False):
+                record = record._asdict()
+                dep = int(record['CRSDepTime'])
+                when = datetime.strptime(record['FlightDate'], '%Y-%m-%d').replace(hour=dep // 100 % 24, minute=dep % 100)
+                row = encoder.encode(record['Origin'], record['Dest'], record[airline_col], when, use_minutes=True)
+                row[distance] = record['Distance']
+                rows.append(row)
+            return np.array(rows, dtype=np.float32)
+
+        # Same shape of data as generate_enhanced_dataset.py, without writing a CSV
+        rng = random.Random(42)
+        airports = list(encoder.vocab['Origin'])
+        airlines = list(encoder.vocab['Operating_Airline'])
+        rows = []
+        for _ in range(limit):
+            when = datetime(2024, 1, 1) + timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+            origin = rng.choice(airports)
+            dest = rng.choice([a for a in airports if a != origin])
+            row = encoder.encode(origin, dest, rng.choice(airlines), when, use_minutes=True)
+            if (origin, dest) not in ml_utils.ROUTE_DISTANCES:
+                row[distance] = rng.randint(300, 2000)
+            rows.append(row)
+        return np.array(rows, dtype=np.float32)
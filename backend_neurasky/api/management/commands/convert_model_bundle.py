@@ -0,0 +1,62 @@
+import os
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api import ml_utils
+from api.model_bundle import BUNDLE_FILENAME, write_bundle, vocabularies_from_encoder
+
+
+class Command(BaseCommand):
+    help = 'Converts the legacy joblib model artifacts into a single checksummed model bundle'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help='Folder with the .joblib artifacts (default: ML_ARTIFACT_DIR or api/)')
+        parser.add_argument('--output', help=f'Bundle path (default: <directory>/{BUNDLE_FILENAME})')
+        parser.add_argument('--repeat', type=int, default=5, help='Loads to time for each format')
+
+    def handle(self, *args, **options):
+        import joblib
+
+        directory = options['directory'] or ml_utils.artifact_dir()
+        output = options['output'] or os.path.join(directory, BUNDLE_FILENAME)
+        missing = [name for name in ml_utils.ARTIFACT_FILES.values() if not os.path.exists(os.path.join(directory, name))]
+        if missing:
+            raise CommandError(f"Missing artifacts in {directory}: {', '.join(missing)}")
+
+        artifacts = {key: joblib.load(os.path.join(directory, name)) for key, name in ml_utils.ARTIFACT_FILES.items()}
+        manifest = write_bundle(
+            output,
+            artifacts['model'].booster_,
+            artifacts['feature_names'],
+            vocabularies_from_encoder(artifacts['encoder']),
+            artifacts['metrics'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Wrote {output} ({os.path.getsize(output) / 1024:.0f} KB), version {manifest['model_version']}"))
+
+        # Both formats have to give the same answers before anyone switches over
+        legacy = ml_utils._load_legacy_artifacts(directory)
+        bundle = ml_utils._load_bundle_file(output)
+        X = bundle.feature_encoder.encode_many([
+            {'origin': origin, 'destination': dest, 'airline': airline, 'departure_time': None}
+            for (origin, dest) in ml_utils.ROUTE_DISTANCES for airline in ('MH', 'AK', 'ZZ')
+        ])
+        diff = np.abs(legacy.booster.predict(X) - bundle.booster.predict(X)).max()
+        diff_evaluator = np.abs(legacy.tree_evaluator.predict_proba(X) - bundle.tree_evaluator.predict_proba(X)).max()
+        if diff > 1e-12 or diff_evaluator > 1e-12:
+            raise CommandError(f"Bundle predictions differ from the joblib model by {max(diff, diff_evaluator):.2e}")
+
+        self.stdout.write(f"Load time, median of {options['repeat']} (libraries already imported):")
+        for name, load in [
+            ('joblib artifacts', lambda: ml_utils._load_legacy_artifacts(directory)),
+            ('model bundle', lambda: ml_utils._load_bundle_file(output)),
+        ]:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                load()
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(f"  {name:<18} {statistics.median(timings) * 1000:8.1f} ms")
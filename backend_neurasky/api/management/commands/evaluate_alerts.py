@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import mailer
+from api.alerts import evaluate_delay_alerts
+
+
+class Command(BaseCommand):
+    help = ("Creates delay alerts (and queues their emails) for every user's delayed flights. "
+            "Runs once (cron), or keeps going with --loop (started by entrypoint.sh)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Evaluate every --interval seconds until stopped')
+        parser.add_argument('--interval', type=float, default=settings.ALERT_EVALUATE_INTERVAL,
+                            help='Seconds between passes with --loop (ALERT_EVALUATE_INTERVAL)')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            self.evaluate()
+            return
+        try:
+            while True:
+                # A dropped database connection shouldn't end the loop, the next pass retries
+                close_old_connections()
+                try:
+                    self.evaluate(quiet=True)
+                except Exception as e:
+                    self.stderr.write(f"⚠️ Alert evaluation failed, retrying in {options['interval']:.0f}s. Error: {e}")
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def evaluate(self, quiet=False):
+        started = time.perf_counter()
+        created = evaluate_delay_alerts()
+        # The loop only reports passes that did something
+        if created or not quiet:
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Created {len(created):,} delay alerts in {time.perf_counter() - started:.2f}s, "
+                f"mail queue: {mailer.stats()}"))
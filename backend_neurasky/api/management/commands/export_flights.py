@@ -0,0 +1,72 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api import exports
+
+
+class Command(BaseCommand):
+    help = 'Streams FlightHistory (or one user\'s tracked flights) to a CSV/Parquet file in bounded memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=['history', 'tracked'])
+        parser.add_argument('--output', '-o', default='-', help="File to write, '-' for stdout")
+        parser.add_argument('--type', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--no-gzip', action='store_true', help='Plain CSV instead of .csv.gz')
+        parser.add_argument('--user', help='Username whose tracked flights to export (tracked only)')
+        parser.add_argument('--start', help='First day, YYYY-MM-DD')
+        parser.add_argument('--end', help='Last day, YYYY-MM-DD')
+        parser.add_argument('--airline', default='', help='Comma separated airline codes')
+        parser.add_argument('--chunk-size', type=int, help='Rows per query (default EXPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        start, end = (self._date(options[name], name) for name in ('start', 'end'))
+        airlines = [a.strip() for a in options['airline'].split(',') if a.strip()]
+        if options['dataset'] == 'tracked':
+            if not options['user']:
+                raise CommandError('--user is required for tracked flights')
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['user']}")
+            queryset, columns = exports.tracked_flights(user, start, end, airlines)
+        else:
+            queryset, columns = exports.flight_history(start, end, airlines)
+
+        counts = {'rows': 0}
+        started = time.perf_counter()
+        try:
+            stream = exports.export_stream(queryset, columns, options['type'], gzip=not options['no_gzip'],
+                                           chunk_size=options['chunk_size'], counts=counts)
+        except exports.ExportError as e:
+            raise CommandError(str(e))
+
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for piece in stream:
+                output.write(piece)
+                written += len(piece)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        elapsed = time.perf_counter() - started
+        # Progress goes to stderr, stdout may be the export itself
+        self.stderr.write(self.style.SUCCESS(
+            f"✅ Exported {counts['rows']:,} rows ({written / 1e6:,.1f} MB) in {elapsed:.2f}s "
+            f"({counts['rows'] / elapsed if elapsed else 0:,.0f} rows/s)"))
+
+    def _date(self, value, name):
+        if not value:
+            return None
+        try:
+            parsed = parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise CommandError(f'--{name} must be a date (YYYY-MM-DD)')
+        return parsed
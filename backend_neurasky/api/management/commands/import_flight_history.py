@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.history_import import ImportFileError, import_file
+
+
+class Command(BaseCommand):
+    help = 'Streams BTS-style flight CSV/Parquet files into FlightHistory in chunks (resumable, skips rows already imported)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='.csv, .csv.gz or .parquet files')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Source rows read and committed per transaction')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and read files from the top')
+        parser.add_argument('--progress-every', type=int, default=100000, help='Print progress every N rows read')
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            self._import(path, options)
+
+    def _import(self, path, options):
+        started = time.perf_counter()
+        next_report = [options['progress_every']]
+
+        def progress(counts):
+            if counts['read'] >= next_report[0]:
+                next_report[0] += options['progress_every']
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"   {counts['read']:,} rows read, {counts['imported']:,} imported "
+                                  f"({counts['read'] / elapsed:,.0f} rows/s)")
+
+        self.stdout.write(f"📥 Importing {path}")
+        try:
+            counts = import_file(path, chunk_size=options['chunk_size'], batch_size=options['batch_size'],
+                                 restart=options['restart'], progress=progress)
+        except (ImportFileError, OSError) as e:
+            raise CommandError(str(e))
+
+        if counts['already_done']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {path} was already imported, --restart to read it again (already imported rows are skipped)"))
+            return
+        if counts['resumed_after']:
+            self.stdout.write(f"🔄 Resumed after row {counts['resumed_after']:,}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Imported {counts['imported']:,} of {counts['read']:,} rows in {elapsed:.2f}s "
+            f"({counts['read'] / elapsed if elapsed else 0:,.0f} rows/s), "
+            f"{counts['duplicates']:,} already there, {counts['invalid']:,} unusable"))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import caching, rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the FlightHistory daily/monthly rollups behind the analytics views, or checks them (--check)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='FlightHistory rows read per query')
+        parser.add_argument('--check', action='store_true', help='Only compare the rollups with the raw table')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if not options['check']:
+            seen = rollups.rebuild(chunk_size=options['chunk_size'])
+            caching.invalidate('analytics')
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Rebuilt rollups from {seen:,} history rows in {time.perf_counter() - started:.2f}s"))
+            started = time.perf_counter()
+
+        problems = rollups.check()
+        if problems:
+            for problem in problems[:50]:
+                self.stdout.write(self.style.ERROR(f"❌ {problem}"))
+            raise CommandError(f"Rollups disagree with FlightHistory in {len(problems)} places, "
+                               f"run `manage.py rebuild_rollups`")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Rollups match FlightHistory (checked in {time.perf_counter() - started:.2f}s)"))
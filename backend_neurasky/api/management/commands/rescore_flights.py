@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import caching, ml_utils
+from api.models import TrackedFlight
+
+
+class Command(BaseCommand):
+    help = "Re-scores tracked flights whose stored risk snapshot is missing or from another model version"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Flights scored and written per batch')
+        parser.add_argument('--all', action='store_true', help='Include flights that already departed')
+        parser.add_argument('--force', action='store_true', help='Re-score even if the snapshot is current')
+
+    def handle(self, *args, **options):
+        bundle = ml_utils.REGISTRY.current()
+        if bundle is None:
+            raise CommandError('Model is not loaded, run the training script first')
+
+        now = timezone.now()
+        flights = TrackedFlight.objects.exclude(origin__isnull=True).exclude(destination__isnull=True)
+        if not options['all']:
+            flights = flights.filter(departureTime__gte=now)
+        if not options['force']:
+            # exclude() on a nullable column keeps the never-scored (NULL) rows too
+            flights = flights.exclude(risk_model_version=bundle.version)
+        flights = flights.only('id', 'user_id', 'origin', 'destination', 'airline', 'departureTime').order_by('pk')
+
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+        seen = updated = 0
+        users = set()
+        chunk = []
+        for flight in flights.iterator(chunk_size=chunk_size):
+            chunk.append(flight)
+            if len(chunk) >= chunk_size:
+                updated += self._write(chunk, bundle, now, users)
+                seen += len(chunk)
+                chunk = []
+        if chunk:
+            updated += self._write(chunk, bundle, now, users)
+            seen += len(chunk)
+
+        # The raw UPDATE skips the post_save signals, drop the cached flight lists here instead
+        for user_id in users:
+            caching.invalidate('tracked_flights', scope=user_id)
+
+        elapsed = time.perf_counter() - started
+        rate = seen / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Re-scored {updated:,} of {seen:,} flights with model {bundle.version} "
+            f"in {elapsed:.2f}s ({rate:,.0f} rows/s)"))
+        if updated < seen:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {seen - updated:,} flights got no model answer (degraded scoring), run again later"))
+
+    def _write(self, chunk, bundle, scored_at, users):
+        scored = ml_utils.snapshot_flight_risk(chunk, bundle=bundle, scored_at=scored_at)
+        # One executemany instead of bulk_update(), which builds a CASE WHEN per row and
+        # field and spent most of the run compiling expressions
+        fields = [TrackedFlight._meta.get_field(name) for name in ml_utils.RISK_SNAPSHOT_FIELDS]
+        assignments = ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in fields)
+        sql = f'UPDATE {connection.ops.quote_name(TrackedFlight._meta.db_table)} SET {assignments} WHERE id = %s'
+        rows = [
+            [field.get_db_prep_save(getattr(flight, field.attname), connection) for field in fields] + [flight.pk]
+            for flight in scored
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        users.update(flight.user_id for flight in scored)
+        return len(scored)
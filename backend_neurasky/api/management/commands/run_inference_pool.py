@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import ml_utils
+from api.inference_pool import InferenceServer
+
+
+class Command(BaseCommand):
+    help = 'Runs the scoring process pool the web workers send predictions to (ML_INFERENCE_SOCKET)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.ML_INFERENCE_SOCKET,
+                            help='Unix socket path or host:port to listen on (default: ML_INFERENCE_SOCKET)')
+        parser.add_argument('--processes', type=int, default=settings.ML_INFERENCE_PROCESSES,
+                            help='Scoring processes, each takes one core')
+        parser.add_argument('--max-pending', type=int, default=settings.ML_INFERENCE_MAX_PENDING,
+                            help="Requests in flight before new ones are answered 'busy'")
+
+    def handle(self, *args, **options):
+        if not options['socket']:
+            raise CommandError('Set ML_INFERENCE_SOCKET or pass --socket')
+
+        # The pool scores in-process, it must never forward to itself
+        ml_utils.IS_INFERENCE_POOL = True
+        # Loaded and warmed before forking so the scoring processes share the model pages
+        if not ml_utils.warm_up():
+            raise CommandError('Model is not loaded, run the training script first')
+
+        server = InferenceServer(
+            options['socket'],
+            ml_utils._score_in_pool,
+            ml_utils.inference_authkey(),
+            processes=options['processes'],
+            max_pending=options['max_pending'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"🧠 Inference pool serving model {ml_utils.REGISTRY.current().version} on {options['socket']} "
+            f"with {options['processes']} processes, max {options['max_pending']} pending"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import mailer
+
+
+class Command(BaseCommand):
+    help = 'Sends queued email (OutboundEmail) in batches over one SMTP connection, with retries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send what is due now and exit')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per SMTP connection (MAIL_BATCH_SIZE)')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds to sleep when nothing is due')
+
+    def handle(self, *args, **options):
+        # One limiter for the whole run so the pace holds across batches
+        limiter = mailer.RateLimiter(getattr(settings, 'MAIL_SEND_RATE', 14))
+        totals = {'sent': 0, 'retry': 0, 'dead': 0}
+        started = time.perf_counter()
+        while True:
+            counts = mailer.send_queued(batch_size=options['batch_size'], limiter=limiter)
+            for key in totals:
+                totals[key] += counts[key]
+            if any(counts.values()):
+                self.stdout.write(f"📧 Sent {counts['sent']}, retrying {counts['retry']}, dead {counts['dead']}")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
+
+        elapsed = time.perf_counter() - started
+        rate = totals['sent'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Sent {totals['sent']:,} emails in {elapsed:.2f}s ({rate:,.1f} msg/s), "
+            f"{totals['retry']:,} to retry, {totals['dead']:,} dead"))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.digest import run_weekly_digest
+
+
+class Command(BaseCommand):
+    help = "Queues this week's digest email for every opted-in user, run it weekly from cron (safe to re-run)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users loaded and queued per transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes rendering the emails, more than 1 forks a pool (default: render in this process)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = run_weekly_digest(chunk_size=options['chunk_size'], workers=options['workers'])
+        if counts['already_done']:
+            self.stdout.write(self.style.WARNING("⚠️ This week's digest was already queued, nothing to do"))
+            return
+
+        elapsed = time.perf_counter() - started
+        users = counts['queued'] + counts['skipped']
+        if counts['resumed_after']:
+            self.stdout.write(f"🔄 Resumed after user id {counts['resumed_after']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Queued {counts['queued']:,} weekly digests ({counts['skipped']:,} users had nothing to report) "
+            f"in {elapsed:.2f}s ({users / elapsed if elapsed else 0:,.0f} users/s), `send_queued_mail` sends them"))
@@ -0,0 +1,179 @@
+"""
+Dynamic micro-batching for model scoring.
+
+Concurrent requests in the same process (gunicorn gthread workers, runserver threads)
+each score a row or two. The batcher queues those calls and a dispatcher thread flushes
+them as one model call once `window` seconds have passed since the oldest queued call,
+or as soon as `max_batch_rows` rows are waiting. Each caller gets a Future with its own
+slice of the result.
+
+Nothing in here imports Django, ml_utils builds the serving instance from settings.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatcherFull(RuntimeError):
+    """The queue is at max_queue calls, the caller should score directly (or shed load)."""
+
+
+class _Call:
+    __slots__ = ('X', 'contributions', 'bundle', 'future', 'enqueued_at')
+
+    def __init__(self, X, contributions, bundle):
+        self.X = X
+        self.contributions = contributions
+        self.bundle = bundle
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    `score_fn(X, contributions=..., bundle=...)` is called with the stacked rows of every
+    call in a batch and must return score()'s dict of per-row arrays. Calls holding
+    different bundles (a reload landed mid-window) are scored separately.
+    """
+
+    def __init__(self, score_fn, window=0.002, max_batch_rows=64, max_queue=256, history=2048):
+        self.score_fn = score_fn
+        self.window = window
+        self.max_batch_rows = max_batch_rows
+        self.max_queue = max_queue
+        self._history = history
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._carry = None
+        self._counts = {'calls': 0, 'rows': 0, 'batches': 0, 'rejected': 0, 'errors': 0}
+        self._waits = deque(maxlen=self._history)
+        self._batch_rows = deque(maxlen=self._history)
+
+    def submit(self, X, contributions=False, bundle=None):
+        """Queues encoded rows X, returns a Future for their score() result. Raises BatcherFull."""
+        self._ensure_started()
+        call = _Call(X, contributions, bundle)
+        try:
+            self._queue.put_nowait(call)
+        except queue.Full:
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise BatcherFull(f"Scoring queue is full ({self.max_queue} calls waiting)") from None
+        return call.future
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Never let the dispatcher die, every later request would hang on it
+                print(f"⚠️ Micro-batcher error: {e}")
+                for call in batch:
+                    if not call.future.done():
+                        call.future.set_exception(e)
+
+    def _collect(self):
+        """Blocks for the first call, then gathers more until the window closes or the batch is full."""
+        first, self._carry = self._carry, None
+        if first is None:
+            first = self._queue.get()
+        batch, rows = [first], len(first.X)
+        deadline = first.enqueued_at + self.window
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.perf_counter()
+            try:
+                call = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if rows + len(call.X) > self.max_batch_rows:
+                # Starts the next batch instead of overshooting this one
+                self._carry = call
+                break
+            batch.append(call)
+            rows += len(call.X)
+        return batch
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        # Callers that gave up (timed out and cancelled) are dropped here
+        batch = [call for call in batch if call.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        groups = {}
+        for call in batch:
+            groups.setdefault(id(call.bundle), []).append(call)
+
+        for calls in groups.values():
+            X = calls[0].X if len(calls) == 1 else np.concatenate([call.X for call in calls])
+            contributions = any(call.contributions for call in calls)
+            try:
+                result = self.score_fn(X, contributions=contributions, bundle=calls[0].bundle)
+            except Exception as e:
+                with self._lock:
+                    self._counts['errors'] += len(calls)
+                for call in calls:
+                    call.future.set_exception(e)
+                continue
+
+            offset = 0
+            for call in calls:
+                end = offset + len(call.X)
+                part = {key: value[offset:end] if isinstance(value, np.ndarray) else value
+                        for key, value in result.items()}
+                if not call.contributions:
+                    part.pop('contributions', None)
+                    part.pop('bias', None)
+                call.future.set_result(part)
+                offset = end
+
+        with self._lock:
+            self._counts['calls'] += len(batch)
+            self._counts['rows'] += sum(len(call.X) for call in batch)
+            self._counts['batches'] += 1
+            self._waits.extend(started - call.enqueued_at for call in batch)
+            self._batch_rows.append(sum(len(call.X) for call in batch))
+
+    def stats(self):
+        """Counters plus queue-wait and batch-size distributions over the recent batches."""
+        with self._lock:
+            waits = np.array(self._waits) * 1000
+            sizes = np.array(self._batch_rows)
+            data = dict(self._counts)
+        data.update({
+            'window_ms': self.window * 1000,
+            'max_batch_rows': self.max_batch_rows,
+            'max_queue': self.max_queue,
+            'queue_depth': self._queue.qsize(),
+            'queue_wait_ms': {
+                'p50': round(float(np.percentile(waits, 50)), 3),
+                'p99': round(float(np.percentile(waits, 99)), 3),
+                'max': round(float(waits.max()), 3),
+            } if len(waits) else None,
+            'batch_rows': {
+                'mean': round(float(sizes.mean()), 2),
+                'p99': float(np.percentile(sizes, 99)),
+                'max': int(sizes.max()),
+            } if len(sizes) else None,
+        })
+        return data
+
+    def _after_fork(self):
+        # The dispatcher thread doesn't survive fork and the queue lock may be held
+        self._reset()
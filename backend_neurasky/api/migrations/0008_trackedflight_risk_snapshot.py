@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_trackedflight_airline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trackedflight',
+            name='risk_level',
+            field=models.CharField(blank=True, choices=[('Low', 'Low'), ('Medium', 'Medium'), ('High', 'High')], max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackedflight',
+            name='risk_model_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackedflight',
+            name='risk_probability',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trackedflight',
+            name='risk_scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:28
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def delay_bucket(delay_minutes):
+    # Frozen copy of api.rollups.delay_bucket as of this migration
+    delay_minutes = delay_minutes or 0
+    if delay_minutes <= 0:
+        return 'on_time'
+    if delay_minutes <= 30:
+        return '1-30'
+    if delay_minutes <= 60:
+        return '30-60'
+    return '60+'
+
+
+def backfill_rollups(apps, schema_editor):
+    # Same result as api.rollups.rebuild() at the time, kept here so later changes to
+    # rollups.py can't change what this migration does
+    FlightHistory = apps.get_model('api', 'FlightHistory')
+    FlightHistoryDaily = apps.get_model('api', 'FlightHistoryDaily')
+    FlightHistoryMonthly = apps.get_model('api', 'FlightHistoryMonthly')
+    tz = timezone.get_current_timezone()
+    totals = defaultdict(lambda: [0, 0])
+    last_pk = 0
+    while True:
+        chunk = list(FlightHistory.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .values_list('pk', 'airline', 'status', 'delay_minutes', 'recorded_at')[:5000])
+        if not chunk:
+            break
+        for _, airline, status, delay_minutes, recorded_at in chunk:
+            day = recorded_at.astimezone(tz).date() if recorded_at.tzinfo is not None else recorded_at.date()
+            key = (airline or '', status, delay_bucket(delay_minutes))
+            for level, period in (('day', day), ('month', day.replace(day=1))):
+                total = totals[(level, period) + key]
+                total[0] += 1
+                total[1] += delay_minutes or 0
+        last_pk = chunk[-1][0]
+
+    for model, level, period_field in ((FlightHistoryDaily, 'day', 'day'), (FlightHistoryMonthly, 'month', 'month')):
+        model.objects.bulk_create([
+            model(**{period_field: period}, airline=airline, status=status, delay_bucket=bucket,
+                  flights=flights, delay_minutes_total=minutes)
+            for (row_level, period, airline, status, bucket), (flights, minutes) in totals.items()
+            if row_level == level
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_jobcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightHistoryDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('airline', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(max_length=50)),
+                ('delay_bucket', models.CharField(choices=[('on_time', 'On-Time'), ('1-30', '1-30 min'), ('30-60', '30-60 min'), ('60+', '60+ min')], max_length=10)),
+                ('flights', models.BigIntegerField(default=0)),
+                ('delay_minutes_total', models.BigIntegerField(default=0)),
+                ('day', models.DateField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'airline', 'status', 'delay_bucket'), name='unique_flight_history_daily')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FlightHistoryMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('airline', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(max_length=50)),
+                ('delay_bucket', models.CharField(choices=[('on_time', 'On-Time'), ('1-30', '1-30 min'), ('30-60', '30-60 min'), ('60+', '60+ min')], max_length=10)),
+                ('flights', models.BigIntegerField(default=0)),
+                ('delay_minutes_total', models.BigIntegerField(default=0)),
+                ('month', models.DateField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('month', 'airline', 'status', 'delay_bucket'), name='unique_flight_history_monthly')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_flight_history_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['user', 'read'], name='alert_user_read_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['user', 'timestamp'], name='alert_user_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['user', 'flightNumber', 'type', 'timestamp'], name='alert_user_flight_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flighthistory',
+            index=models.Index(fields=['recorded_at'], name='history_recorded_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flighthistory',
+            index=models.Index(fields=['status'], name='history_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flighthistory',
+            index=models.Index(fields=['delay_minutes'], name='history_delay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trackedflight',
+            index=models.Index(fields=['user', 'departureTime'], name='tracked_user_departure_idx'),
+        ),
+    ]
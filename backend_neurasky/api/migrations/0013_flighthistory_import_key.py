@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flighthistory',
+            name='import_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -1,66 +1,573 @@
 import os
-import joblib
-import pandas as pd
+import time
+import hashlib
+import threading
 import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, replace
 from django.conf import settings
+from django.utils import timezone
 from datetime import datetime
 
-# Global variables to hold model artifacts
-ML_MODEL = None
-DATA_ENCODER = None
-FEATURE_NAMES = None
-TRAINING_METRICS = None
+from .tree_evaluator import TreeEvaluator
+from .model_bundle import BUNDLE_FILENAME, BundleError, read_bundle, vocabularies_from_encoder
+from .micro_batcher import BatcherFull, MicroBatcher
+from .inference_pool import InferenceClient, PoolUnavailable
 
-def load_ml_model():
+# Pre-bundle artifact files, still loaded when there's no BUNDLE_FILENAME
+# (convert them with `manage.py convert_model_bundle`)
+ARTIFACT_FILES = {
+    'model': 'flight_delay_model.joblib',
+    'encoder': 'flight_data_encoder.joblib',
+    'feature_names': 'model_features.joblib',
+    'metrics': 'training_metrics.joblib',
+}
+# Touched by the admin reload endpoint so every worker's watcher picks the reload up
+RELOAD_MARKER = '.model_reload'
+
+# Batches bigger than this are handed to LightGBM's booster, which wins in bulk
+EVALUATOR_MAX_ROWS = 16
+
+# Every probability -> label rule lives here, override through settings if needed.
+# Levels are checked top-down, a probability strictly above the cut-off gets the level.
+RISK_THRESHOLDS = getattr(settings, 'ML_RISK_THRESHOLDS', {
+    # calculate_flight_risk and the route forecast
+    'risk': (('High', 0.6), ('Medium', 0.3)),
+    # predict_delay is more conservative before calling a flight high risk
+    'prediction': (('High', 0.7), ('Medium', 0.4)),
+})
+# Same cut-off LGBMClassifier.predict uses for the delayed class
+DELAY_THRESHOLD = getattr(settings, 'ML_DELAY_THRESHOLD', 0.5)
+
+class FeatureEncoder:
+    """
+    Pandas-free replacement for OrdinalEncoder.transform + feature_names reindexing.
+    Built once from the category vocabularies ({column: [category, ...]}, in the fitted
+    OrdinalEncoder's categories_ order), it turns a flight into a float32 row in
+    feature_names order using plain dict lookups.
+    Unknown categories are encoded as -1, same as the OrdinalEncoder's unknown_value.
+    """
+
+    # Columns that only depend on the departure time, the rest depend on route/airline
+    TIME_FEATURES = {'Month', 'DayOfWeek', 'CRSDepTime', 'Hour', 'IsPeakHour', 'IsWeekend', 'TimeOfDay'}
+
+    def __init__(self, vocabularies, feature_names):
+        self.feature_names = list(feature_names)
+        self.vocab = {
+            str(column): {str(category): code for code, category in enumerate(categories)}
+            for column, categories in vocabularies.items()
+        }
+        self.time_mask = np.array([name in self.TIME_FEATURES for name in self.feature_names], dtype=bool)
+
+    def _code(self, column, value):
+        return self.vocab[column].get(value, -1) if column in self.vocab else value
+
+    def encode(self, origin, destination, airline, departure_time=None, use_minutes=False, out=None):
+        """
+        Encodes a single flight. Risk scoring uses hour * 100 as CRSDepTime,
+        predict_delay passes use_minutes=True to keep the scheduled minute.
+        Writes into `out` when given, otherwise allocates a new row.
+        """
+        current_time = departure_time if departure_time else datetime.now()
+        month = current_time.month
+        day_of_week = current_time.isoweekday()
+        hour = current_time.hour
+        crs_dep_time = hour * 100 + (current_time.minute if use_minutes else 0)
+
+        values = {
+            'Month': month,
+            'DayOfWeek': day_of_week,
+            'CRSDepTime': crs_dep_time,
+            'Operating_Airline': self._code('Operating_Airline', airline),
+            'Origin': self._code('Origin', origin),
+            'Dest': self._code('Dest', destination),
+            'Distance': get_estimated_distance(origin, destination),
+            'Hour': hour,
+            'IsInternational': int(is_international_route(origin, destination)),
+            'IsPeakHour': int(is_peak_hour(hour)),
+            'IsWeekend': int(day_of_week in [6, 7]),
+            'TimeOfDay': self._code('TimeOfDay', get_time_of_day(hour))
+        }
+
+        if out is None:
+            out = np.empty(len(self.feature_names), dtype=np.float32)
+        # Features the model knows about but we don't compute default to 0
+        out[:] = [values.get(feature, 0) for feature in self.feature_names]
+        return out
+
+    def encode_many(self, flights, use_minutes=False):
+        """
+        Encodes a sequence of dicts with 'origin', 'destination', 'airline' and
+        'departure_time' keys into one preallocated (n, n_features) matrix.
+        """
+        matrix = np.empty((len(flights), len(self.feature_names)), dtype=np.float32)
+        for i, f in enumerate(flights):
+            self.encode(f['origin'], f['destination'], f.get('airline', 'MH'), f.get('departure_time'),
+                        use_minutes=use_minutes, out=matrix[i])
+        return matrix
+
+    def encode_grid(self, origin, destination, airlines, times):
+        """
+        Encodes every (airline, departure time) combination of one route, airline-major:
+        row i * len(times) + j is airlines[i] departing at times[j]. Each airline and each
+        time is only encoded once, the grid is stitched together with numpy.
+        """
+        route_rows = self.encode_many([
+            {'origin': origin, 'destination': destination, 'airline': airline, 'departure_time': times[0]}
+            for airline in airlines
+        ])
+        time_rows = self.encode_many([
+            {'origin': origin, 'destination': destination, 'airline': airlines[0], 'departure_time': when}
+            for when in times
+        ])
+        grid = np.repeat(route_rows, len(times), axis=0)
+        grid[:, self.time_mask] = np.tile(time_rows[:, self.time_mask], (len(airlines), 1))
+        return grid
+
+class RiskTable:
+    """
+    Precomputed delay probabilities for calculate_flight_risk ("table mode").
+    Risk scoring only depends on month, day of week, hour, airline and route, so for
+    the routes in ROUTE_DISTANCES the whole space is scored once at load time and
+    stored as float16 with axes (route, airline, month, day_of_week, hour).
+    Airline slot 0 holds unknown airlines (encoded as -1).
+    """
+
+    def __init__(self, predict, feature_encoder, routes=None, chunk_size=65536):
+        started = time.perf_counter()
+
+        self.feature_encoder = feature_encoder
+        self.routes = {route: i for i, route in enumerate(routes or ROUTE_DISTANCES)}
+        self.airline_vocab = feature_encoder.vocab.get('Operating_Airline', {})
+        airlines = [None] + sorted(self.airline_vocab, key=self.airline_vocab.get)
+
+        # One encoded row per (route, airline) and one per (month, day_of_week, hour),
+        # combined below so the table uses exactly the same encoding as live scoring
+        sample_time = datetime(2024, 1, 1)
+        route_rows = feature_encoder.encode_many([
+            {'origin': origin, 'destination': dest, 'airline': airline, 'departure_time': sample_time}
+            for (origin, dest) in self.routes for airline in airlines
+        ])
+        time_rows = feature_encoder.encode_many([
+            {'origin': 'KUL', 'destination': 'PEN', 'airline': None,
+             'departure_time': self._sample_datetime(month, day_of_week, hour)}
+            for month in range(1, 13) for day_of_week in range(1, 8) for hour in range(24)
+        ])
+        time_mask = feature_encoder.time_mask
+
+        probs = np.empty(len(route_rows) * len(time_rows), dtype=np.float32)
+        rows_per_chunk = max(1, chunk_size // len(time_rows))
+        for start in range(0, len(route_rows), rows_per_chunk):
+            block = route_rows[start:start + rows_per_chunk]
+            matrix = np.repeat(block, len(time_rows), axis=0)
+            matrix[:, time_mask] = np.tile(time_rows[:, time_mask], (len(block), 1))
+            end = start + len(block)
+            probs[start * len(time_rows):end * len(time_rows)] = predict(matrix)
+
+        self.table = probs.astype(np.float16).reshape(len(self.routes), len(airlines), 12, 7, 24)
+        # Same routes keyed by their encoded (Origin, Dest), for lookups on already encoded rows
+        origin_vocab, dest_vocab = feature_encoder.vocab.get('Origin', {}), feature_encoder.vocab.get('Dest', {})
+        self.encoded_routes = {
+            (origin_vocab[origin], dest_vocab[dest]): i
+            for (origin, dest), i in self.routes.items()
+            if origin in origin_vocab and dest in dest_vocab
+        }
+        self.stats = {
+            'entries': int(self.table.size),
+            'memory_bytes': int(self.table.nbytes),
+            'build_seconds': round(time.perf_counter() - started, 3),
+        }
+
+    @staticmethod
+    def _sample_datetime(month, day_of_week, hour):
+        first = datetime(2024, month, 1)
+        return first.replace(day=1 + (day_of_week - first.isoweekday()) % 7, hour=hour)
+
+    def lookup(self, origin, destination, airline, departure_time):
+        """Returns the delay probability, or None if the route isn't in the table."""
+        route = self.routes.get((origin, destination))
+        if route is None:
+            return None
+        airline_slot = self.airline_vocab.get(airline, -1) + 1
+        return float(self.table[route, airline_slot, departure_time.month - 1,
+                                departure_time.isoweekday() - 1, departure_time.hour])
+
+    def lookup_encoded(self, X):
+        """Probabilities for rows encoded by feature_encoder, NaN where the route isn't in the table."""
+        names = self.feature_encoder.feature_names
+        origin, dest, airline, month, day_of_week, hour = (
+            X[:, names.index(name)].astype(np.int64)
+            for name in ('Origin', 'Dest', 'Operating_Airline', 'Month', 'DayOfWeek', 'Hour')
+        )
+        routes = np.array([self.encoded_routes.get(key, -1) for key in zip(origin.tolist(), dest.tolist())], dtype=np.int64)
+        probs = np.full(len(X), np.nan)
+        found = routes >= 0
+        probs[found] = self.table[routes[found], airline[found] + 1, month[found] - 1,
+                                  day_of_week[found] - 1, hour[found]]
+        return probs
+
+class PredictionCache:
+    """
+    Bounded LRU memo of live-scored risk probabilities, with a TTL on every entry.
+    calculate_flight_risk only depends on (route, airline, month, day of week, hour), so
+    dashboards polling the same tracked flights hit this instead of the model.
+    Keys start with the model version, after a reload the old entries simply stop
+    matching and age out. max_entries=0 turns it off.
     """
-    Loads the ML model and related artifacts into global variables.
-    This should be called when the app starts or when needed.
+
+    def __init__(self, max_entries=10000, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    @staticmethod
+    def key(bundle, origin, destination, airline, departure_time):
+        return (bundle.version, origin, destination, airline,
+                departure_time.month, departure_time.isoweekday(), departure_time.hour)
+
+    def get(self, key):
+        """The cached probability, or None."""
+        if not self.max_entries:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counts['misses'] += 1
+                return None
+            expires_at, probability = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.counts['expirations'] += 1
+                self.counts['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counts['hits'] += 1
+            return probability
+
+    def put(self, key, probability):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, float(probability))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counts['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counts['hits'] + self.counts['misses']
+            return {
+                **self.counts,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hit_rate': round(self.counts['hits'] / lookups, 4) if lookups else None,
+            }
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """
+    One immutable model version: the LightGBM booster plus everything derived from it.
+    A request grabs the current bundle once and uses it until it's done, so a reload
+    in the middle of a request never mixes artifacts from two versions.
     """
-    global ML_MODEL, DATA_ENCODER, FEATURE_NAMES, TRAINING_METRICS
-    
-    # Paths
-    MODEL_PATH = os.path.join(settings.BASE_DIR, 'api', 'flight_delay_model.joblib')
-    ENCODER_PATH = os.path.join(settings.BASE_DIR, 'api', 'flight_data_encoder.joblib')
-    FEATURES_PATH = os.path.join(settings.BASE_DIR, 'api', 'model_features.joblib')
-    METRICS_PATH = os.path.join(settings.BASE_DIR, 'api', 'training_metrics.joblib')
+    version: str
+    booster: object
+    feature_names: list
+    metrics: dict
+    feature_encoder: FeatureEncoder
+    tree_evaluator: TreeEvaluator = None
+    risk_table: RiskTable = None
+    loaded_at: datetime = None
+    # 'bundle' or 'joblib' (legacy artifacts)
+    source: str = 'bundle'
+
+def artifact_dir():
+    return getattr(settings, 'ML_ARTIFACT_DIR', None) or os.path.join(settings.BASE_DIR, 'api')
+
+def artifact_version(directory):
+    """Short sha256 of the legacy artifact files, changes whenever any of them is rewritten."""
+    digest = hashlib.sha256()
+    for name in sorted(ARTIFACT_FILES.values()):
+        with open(os.path.join(directory, name), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
 
+def _load_bundle_file(path):
+    contents = read_bundle(path)
+    return ModelBundle(
+        version=contents['model_version'],
+        booster=contents['booster'],
+        feature_names=contents['feature_names'],
+        metrics=contents['metrics'],
+        feature_encoder=FeatureEncoder(contents['vocabularies'], contents['feature_names']),
+        tree_evaluator=contents['evaluator'],
+        loaded_at=datetime.now(),
+    )
+
+def _load_legacy_artifacts(directory):
+    # joblib pulls in lightgbm/sklearn/pandas when unpickling, keep it off the import path
+    import joblib
+
+    artifacts = {key: joblib.load(os.path.join(directory, name)) for key, name in ARTIFACT_FILES.items()}
+    bundle = ModelBundle(
+        version=artifact_version(directory),
+        booster=artifacts['model'].booster_,
+        feature_names=artifacts['feature_names'],
+        metrics=artifacts['metrics'],
+        feature_encoder=FeatureEncoder(vocabularies_from_encoder(artifacts['encoder']), artifacts['feature_names']),
+        loaded_at=datetime.now(),
+        source='joblib',
+    )
     try:
-        ML_MODEL = joblib.load(MODEL_PATH)
-        DATA_ENCODER = joblib.load(ENCODER_PATH)
-        FEATURE_NAMES = joblib.load(FEATURES_PATH)
-        TRAINING_METRICS = joblib.load(METRICS_PATH)
-        print(f"✅ Enhanced ML Model loaded successfully (ml_utils)")
-        return True
+        bundle = replace(bundle, tree_evaluator=TreeEvaluator.from_booster(bundle.booster))
+    except Exception as e:
+        # Not fatal, predictions go through the LightGBM booster instead
+        print(f"⚠️ Could not build native tree evaluator. Error: {e}")
+    return bundle
+
+def load_ml_model(directory=None):
+    """
+    Loads the ML model and related artifacts from `directory` (artifact_dir() by default)
+    into a new ModelBundle. Returns None if the artifacts can't be loaded.
+    The checksummed BUNDLE_FILENAME is used when present, a bundle that fails its checks
+    is refused rather than falling back to possibly mismatched joblib files.
+    """
+    directory = directory or artifact_dir()
+    bundle_path = os.path.join(directory, BUNDLE_FILENAME)
+    started = time.perf_counter()
+    try:
+        if os.path.exists(bundle_path):
+            bundle = _load_bundle_file(bundle_path)
+        else:
+            print(f"⚠️ No {BUNDLE_FILENAME} found, loading legacy joblib artifacts "
+                  f"(run `python manage.py convert_model_bundle`)")
+            bundle = _load_legacy_artifacts(directory)
+        print(f"✅ Enhanced ML Model loaded successfully (ml_utils), version {bundle.version} "
+              f"from {bundle.source} in {time.perf_counter() - started:.2f}s")
+    except BundleError as e:
+        print(f"❌ CRITICAL ERROR: Model bundle failed verification, refusing to load it. Error: {e}")
+        return None
     except Exception as e:
         print(f"❌ CRITICAL ERROR: Could not load enhanced model in ml_utils. Error: {e}")
+        return None
+
+    if getattr(settings, 'ML_RISK_TABLE_MODE', False):
+        try:
+            risk_table = RiskTable(lambda X: predict_probabilities(X, bundle=bundle), bundle.feature_encoder)
+            bundle = replace(bundle, risk_table=risk_table)
+            print(f"✅ Risk table built: {risk_table.stats['entries']:,} entries, "
+                  f"{risk_table.stats['memory_bytes'] / 1024 / 1024:.1f} MB in {risk_table.stats['build_seconds']}s")
+        except Exception as e:
+            # Table mode is only an optimization, live scoring still works without it
+            print(f"⚠️ Could not build risk table, using live scoring. Error: {e}")
+    return bundle
+
+class ModelRegistry:
+    """
+    Holds the ModelBundle currently serving predictions.
+    The first current() call loads it (so management commands never pay for the model),
+    reload() builds a new bundle next to the old one and swaps the reference atomically.
+    Requests already holding the old bundle finish on it. A failed reload keeps the old one.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._bundle = None
+        self._load_attempted = False
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._watch_interval = 0
+        self._fingerprint = None
+        self._pending_fingerprint = None
+
+    def current(self):
+        """The serving bundle, or None if no model could be loaded."""
+        if not self._load_attempted:
+            with self._lock:
+                if not self._load_attempted:
+                    self._bundle = load_ml_model(self.directory)
+                    self._fingerprint = self.fingerprint()
+                    self._load_attempted = True
+        return self._bundle
+
+    def swap(self, bundle):
+        """Makes `bundle` the serving version, returns the previous one."""
+        with self._lock:
+            previous, self._bundle = self._bundle, bundle
+            self._load_attempted = True
+        return previous
+
+    def reload(self, notify_workers=False):
+        """
+        Loads the artifacts again and swaps them in if they load. With notify_workers the
+        reload marker is touched so watchers in the other worker processes reload too.
+        Returns (new bundle or None, previous bundle).
+        """
+        fingerprint = self.fingerprint()
+        # Built outside the lock, requests keep using the old bundle meanwhile
+        bundle = load_ml_model(self.directory)
+        if bundle is None:
+            return None, self.current()
+        previous = self.swap(bundle)
+        self._fingerprint = fingerprint
+        if notify_workers:
+            self._touch_marker()
+        print(f"🔄 Model reloaded: {previous.version if previous else None} -> {bundle.version}")
+        return bundle, previous
+
+    def fingerprint(self):
+        """mtime/size of every artifact plus the reload marker, cheap enough to poll."""
+        directory = self.directory or artifact_dir()
+        stats = []
+        for name in [BUNDLE_FILENAME] + sorted(ARTIFACT_FILES.values()) + [RELOAD_MARKER]:
+            try:
+                st = os.stat(os.path.join(directory, name))
+                stats.append((name, st.st_mtime_ns, st.st_size))
+            except OSError:
+                stats.append((name, None, None))
+        return tuple(stats)
+
+    def _touch_marker(self):
+        path = os.path.join(self.directory or artifact_dir(), RELOAD_MARKER)
+        try:
+            open(path, 'a').close()
+            os.utime(path)
+        except OSError as e:
+            print(f"⚠️ Could not touch model reload marker, other workers won't reload. Error: {e}")
+
+    def check_for_changes(self):
+        """
+        One watcher tick: reloads when the fingerprint changed and then stayed the same
+        for a whole tick, so a training script halfway through writing files is skipped.
+        """
+        fingerprint = self.fingerprint()
+        if fingerprint == self._fingerprint:
+            return False
+        if fingerprint != self._pending_fingerprint:
+            self._pending_fingerprint = fingerprint
+            return False
+        self._pending_fingerprint = None
+        bundle, _ = self.reload()
+        if bundle is None:
+            # Don't retry a broken set of files every tick, wait for the next change
+            self._fingerprint = fingerprint
+        return bundle is not None
+
+    def reload_if_changed(self):
+        """
+        Reloads straight away if the artifacts changed since the serving bundle was loaded,
+        without the watcher's settle tick. For callers that already know a newer version
+        exists (the inference pool being asked for it). Returns the serving bundle.
+        """
+        self.current()
+        fingerprint = self.fingerprint()
+        if fingerprint != self._fingerprint:
+            bundle, _ = self.reload()
+            if bundle is None:
+                # Same as the watcher, don't rebuild a broken set of files on every call
+                self._fingerprint = fingerprint
+        return self.current()
+
+    def start_watcher(self, interval=None):
+        """Starts a daemon thread polling the artifact files every `interval` seconds."""
+        interval = interval if interval is not None else getattr(settings, 'ML_MODEL_WATCH_INTERVAL', 0)
+        if not interval or (self._watcher and self._watcher.is_alive()):
+            return False
+        self._watch_interval = interval
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.check_for_changes()
+                except Exception as e:
+                    print(f"⚠️ Model watcher error: {e}")
+
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+        print(f"👀 Watching model artifacts every {interval}s")
+        return True
+
+    def _after_fork(self):
+        # Forked workers (gunicorn preload) don't inherit threads and may inherit a held lock
+        self._lock = threading.Lock()
+        watching, self._watcher = self._watch_interval, None
+        if watching:
+            self.start_watcher(watching)
+
+REGISTRY = ModelRegistry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=REGISTRY._after_fork)
+
+def ensure_model_loaded():
+    """Loads the serving model if needed. Returns True when a model is available."""
+    return REGISTRY.current() is not None
+
+def warm_up(rounds=3):
+    """
+    Startup hook for serving processes (wsgi.py, or the gunicorn master with
+    preload_app). Loads the artifacts and runs synthetic predictions through the
+    single-row, batch and contributions paths so the first real request pays for none of it.
+    Also starts the artifact watcher when ML_MODEL_WATCH_INTERVAL is set.
+    """
+    started = time.perf_counter()
+    bundle = REGISTRY.current()
+    if bundle is None:
         return False
 
-# Initialize on module import (optional, or call explicitly in AppConfig)
-load_ml_model()
+    now = datetime.now()
+    flights = [
+        {'origin': origin, 'destination': dest, 'airline': 'MH', 'departure_time': now.replace(hour=hour)}
+        for (origin, dest) in ROUTE_DISTANCES for hour in (6, 12, 18)
+    ]
+    for _ in range(rounds):
+        for f in flights[:EVALUATOR_MAX_ROWS]:
+            calculate_flight_risk(f['origin'], f['destination'], f['departure_time'], f['airline'], bundle=bundle)
+        calculate_flight_risk_batch(flights, bundle=bundle)
+        score(bundle.feature_encoder.encode_many(flights[:1], use_minutes=True), contributions=True, bundle=bundle)
+
+    print(f"🔥 ML model {bundle.version} warmed up with {rounds * (EVALUATOR_MAX_ROWS + len(flights) + 1)} "
+          f"synthetic predictions in {time.perf_counter() - started:.2f}s")
+    REGISTRY.start_watcher()
+    return True
 
 # Helper Functions used in Prediction
+ROUTE_DISTANCES = {
+    ('KUL', 'PEN'): 325, ('PEN', 'KUL'): 325,
+    ('KUL', 'BKI'): 1630, ('BKI', 'KUL'): 1630,
+    ('KUL', 'KCH'): 975, ('KCH', 'KUL'): 975,
+    ('KUL', 'LGK'): 300, ('LGK', 'KUL'): 300,
+    ('KUL', 'JHB'): 280, ('JHB', 'KUL'): 280,
+    ('KUL', 'AOR'): 650, ('AOR', 'KUL'): 650,
+    ('KUL', 'MYY'): 1150, ('MYY', 'KUL'): 1150,
+    ('PEN', 'BKI'): 1350, ('BKI', 'PEN'): 1350,
+    ('PEN', 'KCH'): 750, ('KCH', 'PEN'): 750,
+    ('KUL', 'SIN'): 296, ('SIN', 'KUL'): 296,
+    ('KUL', 'BKK'): 1220, ('BKK', 'KUL'): 1220,
+    ('KUL', 'HKG'): 2560, ('HKG', 'KUL'): 2560,
+    ('KUL', 'NRT'): 5320, ('NRT', 'KUL'): 5320,
+    ('KUL', 'ICN'): 4620, ('ICN', 'KUL'): 4620,
+    ('KUL', 'LHR'): 10600, ('LHR', 'KUL'): 10600,
+    ('KUL', 'SYD'): 6530, ('SYD', 'KUL'): 6530,
+    ('KUL', 'DXB'): 5550, ('DXB', 'KUL'): 5550,
+    ('KUL', 'DOH'): 5630, ('DOH', 'KUL'): 5630,
+}
+
 def get_estimated_distance(origin, dest):
-    distances = {
-        ('KUL', 'PEN'): 325, ('PEN', 'KUL'): 325,
-        ('KUL', 'BKI'): 1630, ('BKI', 'KUL'): 1630,
-        ('KUL', 'KCH'): 975, ('KCH', 'KUL'): 975,
-        ('KUL', 'LGK'): 300, ('LGK', 'KUL'): 300,
-        ('KUL', 'JHB'): 280, ('JHB', 'KUL'): 280,
-        ('KUL', 'AOR'): 650, ('AOR', 'KUL'): 650,
-        ('KUL', 'MYY'): 1150, ('MYY', 'KUL'): 1150,
-        ('PEN', 'BKI'): 1350, ('BKI', 'PEN'): 1350,
-        ('PEN', 'KCH'): 750, ('KCH', 'PEN'): 750,
-        ('KUL', 'SIN'): 296, ('SIN', 'KUL'): 296,
-        ('KUL', 'BKK'): 1220, ('BKK', 'KUL'): 1220,
-        ('KUL', 'HKG'): 2560, ('HKG', 'KUL'): 2560,
-        ('KUL', 'NRT'): 5320, ('NRT', 'KUL'): 5320,
-        ('KUL', 'ICN'): 4620, ('ICN', 'KUL'): 4620,
-        ('KUL', 'LHR'): 10600, ('LHR', 'KUL'): 10600,
-        ('KUL', 'SYD'): 6530, ('SYD', 'KUL'): 6530,
-        ('KUL', 'DXB'): 5550, ('DXB', 'KUL'): 5550,
-        ('KUL', 'DOH'): 5630, ('DOH', 'KUL'): 5630,
-    }
-    return distances.get((origin, dest), 800)
+    return ROUTE_DISTANCES.get((origin, dest), 800)
 
 def is_international_route(origin, dest):
     malaysian_airports = {'KUL', 'PEN', 'BKI', 'KCH', 'LGK', 'JHB', 'AOR', 'MYY', 'SDK', 'TWU'}
@@ -75,73 +582,346 @@ def get_time_of_day(hour):
 def is_peak_hour(hour):
     return hour in [7, 8, 9, 17, 18, 19, 20]
 
-def calculate_flight_risk(origin, destination, departure_time, airline='MH'):
+def predict_probabilities(X, bundle=None):
+    """
+    Probability of delay for each encoded row of X (as built by the bundle's feature_encoder).
+    Small requests use the native tree evaluator and large batches go to the LightGBM
+    booster, neither goes through the sklearn wrapper's per-call input validation.
+    """
+    bundle = bundle or REGISTRY.current()
+    evaluator = bundle.tree_evaluator
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if evaluator is not None and len(X) <= EVALUATOR_MAX_ROWS:
+        return np.array([evaluator.predict_proba_row(row) for row in X.tolist()])
+    return bundle.booster.predict(X)
+
+def score(X, contributions=False, bundle=None):
+    """
+    The one scoring call behind every prediction path. X holds encoded rows.
+    Returns a dict of per-row arrays:
+        'probability'   - probability of delay
+        'is_delayed'    - probability > DELAY_THRESHOLD, what the model's predict would say
+        'contributions' - only with contributions=True: (n_rows, n_features) log-odds
+                          contribution of each feature, with the shared 'bias' alongside
+    plus 'model_version', the bundle that produced them (the serving one by default).
+    With contributions=True the probability comes out of the same tree traversal.
+    Small calls go through the micro-batcher when ML_MICROBATCH_WINDOW_MS is set.
+    With ML_INFERENCE_SOCKET set everything is scored by the inference pool instead, and
+    if it can't answer within ML_INFERENCE_DEADLINE_MS the result is degraded_score()'s.
+    """
+    bundle = bundle or REGISTRY.current()
+    X = np.asarray(X, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+
+    client = get_inference_client()
+    if client is not None:
+        try:
+            return client.score(X, contributions, bundle.version,
+                                timeout=getattr(settings, 'ML_INFERENCE_DEADLINE_MS', 250) / 1000)
+        except PoolUnavailable as e:
+            return degraded_score(X, bundle, reason=e.reason)
+
+    batcher = get_batcher()
+    if batcher is not None and len(X) < batcher.max_batch_rows:
+        try:
+            future = batcher.submit(X, contributions=contributions, bundle=bundle)
+        except BatcherFull:
+            # Back-pressure: past the queue depth, score on the request thread instead
+            return _score_now(X, contributions=contributions, bundle=bundle)
+        try:
+            return future.result(timeout=MICROBATCH_TIMEOUT)
+        except TimeoutError:
+            if not future.cancel():
+                return future.result()
+            print("⚠️ Micro-batcher timed out, scoring directly")
+            return _score_now(X, contributions=contributions, bundle=bundle)
+    return _score_now(X, contributions=contributions, bundle=bundle)
+
+def _score_now(X, contributions=False, bundle=None):
+    """score() without the micro-batcher, X is already a 2D float32 array."""
+    result = {'model_version': bundle.version}
+    if not contributions:
+        probability = predict_probabilities(X, bundle=bundle)
+    elif bundle.tree_evaluator is not None:
+        raw, result['contributions'], result['bias'] = bundle.tree_evaluator.raw_score_with_contributions(X)
+        probability = bundle.tree_evaluator.probability(raw)
+    else:
+        # LightGBM's SHAP values, the last column is the expected value
+        shap = bundle.booster.predict(X, pred_contrib=True)
+        result['contributions'], result['bias'] = shap[:, :-1], float(shap[0, -1])
+        probability = 1.0 / (1.0 + np.exp(-shap.sum(axis=1)))
+
+    result['probability'] = probability
+    result['is_delayed'] = probability > DELAY_THRESHOLD
+    return result
+
+# Dynamic micro-batching of concurrent score() calls, off unless a window is configured.
+# Only useful with several request threads per process (gunicorn GUNICORN_THREADS > 1).
+MICROBATCH_TIMEOUT = 5.0
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def get_batcher():
+    """This process's MicroBatcher, or None when ML_MICROBATCH_WINDOW_MS is 0."""
+    global _batcher
+    window_ms = getattr(settings, 'ML_MICROBATCH_WINDOW_MS', 0)
+    if not window_ms:
+        return None
+    if _batcher is None or _batcher.window != window_ms / 1000:
+        with _batcher_lock:
+            if _batcher is None or _batcher.window != window_ms / 1000:
+                _batcher = MicroBatcher(
+                    _score_now,
+                    window=window_ms / 1000,
+                    max_batch_rows=getattr(settings, 'ML_MICROBATCH_MAX_ROWS', 64),
+                    max_queue=getattr(settings, 'ML_MICROBATCH_QUEUE_DEPTH', 256),
+                )
+    return _batcher
+
+def batcher_stats():
+    return _batcher.stats() if _batcher is not None and get_batcher() is not None else None
+
+def _batcher_after_fork():
+    global _batcher_lock
+    _batcher_lock = threading.Lock()
+    if _batcher is not None:
+        _batcher._after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_batcher_after_fork)
+
+# Out-of-process scoring (`manage.py run_inference_pool`), off unless ML_INFERENCE_SOCKET is set
+_inference_client = None
+# Set by run_inference_pool, the pool itself always scores in-process
+IS_INFERENCE_POOL = False
+
+def inference_authkey():
+    return hashlib.sha256(f"neurasky-inference:{settings.SECRET_KEY}".encode()).digest()
+
+def get_inference_client():
+    """This process's InferenceClient, or None when scoring happens in-process."""
+    global _inference_client
+    address = getattr(settings, 'ML_INFERENCE_SOCKET', '')
+    if not address or IS_INFERENCE_POOL:
+        return None
+    if _inference_client is None or _inference_client.address != address:
+        _inference_client = InferenceClient(address, inference_authkey())
+    return _inference_client
+
+def inference_pool_stats():
+    return _inference_client.stats() if _inference_client is not None and get_inference_client() is not None else None
+
+def _score_in_pool(X, contributions, version, deadline):
+    """InferenceServer job, runs in the pool's scoring processes."""
+    if time.time() > deadline:
+        # The web worker has already given up on this one
+        return ('expired', None)
+    bundle = REGISTRY.current()
+    if bundle is None or bundle.version != version:
+        # The web worker has a model this process hasn't loaded yet (/api/model/reload/, a
+        # new training run), catch up now rather than waiting for a watcher
+        bundle = REGISTRY.reload_if_changed()
+    if bundle is None or bundle.version != version:
+        # Rows were encoded with another version's vocabularies, the web worker degrades
+        return ('stale', bundle.version if bundle else None)
+    return ('ok', _score_now(X, contributions=contributions, bundle=bundle))
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: _inference_client and _inference_client._after_fork())
+
+def degraded_score(X, bundle, reason=''):
+    """
+    Stand-in for score() when the model can't be asked in time: the precomputed risk
+    table where it covers the route, otherwise a rule of thumb around the training set's
+    delay rate. Same keys as score() (no contributions) plus 'degraded'.
+    """
+    names = bundle.feature_names
+    column = lambda name: X[:, names.index(name)] if name in names else np.zeros(len(X))
+
+    distribution = (bundle.metrics or {}).get('class_distribution') or {}
+    total = sum(distribution.values())
+    base_rate = distribution.get('delayed', 0) / total if total else 0.3
+    probability = np.clip(
+        base_rate + 0.15 * column('IsPeakHour') + 0.05 * column('IsInternational') + 0.05 * column('IsWeekend'),
+        0.01, 0.99,
+    )
+    if bundle.risk_table is not None:
+        cached = bundle.risk_table.lookup_encoded(X)
+        found = ~np.isnan(cached)
+        probability[found] = cached[found]
+
+    return {
+        'model_version': bundle.version,
+        'probability': probability,
+        'is_delayed': probability > DELAY_THRESHOLD,
+        'degraded': reason or True,
+    }
+
+def get_risk_level(probability, profile='risk'):
+    """Maps a delay probability to 'High' / 'Medium' / 'Low' using RISK_THRESHOLDS[profile]."""
+    for level, cutoff in RISK_THRESHOLDS[profile]:
+        if probability > cutoff:
+            return level
+    return 'Low'
+
+def _format_risk_result(prob, origin, destination, hour, bundle, degraded=None):
+    result = {
+        'probability': round(float(prob) * 100, 1),
+        'risk_level': get_risk_level(prob),
+        'is_peak': is_peak_hour(hour),
+        'is_international': is_international_route(origin, destination),
+        'model_version': bundle.version
+    }
+    if degraded:
+        # The model didn't answer in time (see degraded_score)
+        result['degraded'] = degraded
+    return result
+
+def risk_result_from_snapshot(flight, bundle):
+    """
+    calculate_flight_risk's result rebuilt from a TrackedFlight's stored risk snapshot.
+    None if there is no snapshot or it was scored by another model than `bundle`.
+    """
+    if bundle is None or flight.risk_probability is None or flight.risk_model_version != bundle.version:
+        return None
+    # Flights without a departure time were scored as departing at risk_scored_at
+    when = flight.departureTime or flight.risk_scored_at
+    return _format_risk_result(flight.risk_probability, flight.origin, flight.destination, when.hour, bundle)
+
+PREDICTION_CACHE = PredictionCache(
+    max_entries=getattr(settings, 'ML_PREDICTION_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'ML_PREDICTION_CACHE_TTL', 3600),
+)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=PREDICTION_CACHE._after_fork)
+
+def calculate_flight_risk(origin, destination, departure_time, airline='MH', bundle=None):
     """
     Calculates the risk of delay for a given flight.
     Returns a dictionary with probability, risk_level, and risk_factors.
     """
-    if not all([ML_MODEL, DATA_ENCODER, FEATURE_NAMES]):
+    bundle = bundle or REGISTRY.current()
+    if bundle is None:
         return {'error': 'Model not loaded'}
 
     try:
         # Prepare Data
         current_time = departure_time if departure_time else datetime.now()
-        month = current_time.month
-        day_of_week = current_time.isoweekday()
-        hour = current_time.hour
-        
-        distance = get_estimated_distance(origin, destination)
-        crs_dep_time = hour * 100
-        
-        input_data = pd.DataFrame([{
-            'Month': month,
-            'DayOfWeek': day_of_week,
-            'CRSDepTime': crs_dep_time,
-            'Operating_Airline': airline,
-            'Origin': origin,
-            'Dest': destination,
-            'Distance': distance,
-            'Hour': hour,
-            'IsInternational': int(is_international_route(origin, destination)),
-            'IsPeakHour': int(is_peak_hour(hour)),
-            'IsWeekend': int(day_of_week in [6, 7]),
-            'TimeOfDay': get_time_of_day(hour)
-        }])
-        
-        # Transform Features
-        categorical_cols = ['Operating_Airline', 'Origin', 'Dest', 'TimeOfDay']
-        try:
-             # Handle unknown categories gracefully if possible, or catch error
-            input_data[categorical_cols] = DATA_ENCODER.transform(input_data[categorical_cols])
-        except Exception as e:
-            # Fallback if unknown route/airport code to avoid crash
-            print(f"Encoding error for {origin}->{destination}: {e}")
-            return {'probability': 0, 'risk_level': 'Unknown', 'reason': 'Unknown Route'}
-
-        for feature in FEATURE_NAMES:
-            if feature not in input_data.columns:
-                input_data[feature] = 0
-                
-        input_data = input_data[FEATURE_NAMES]
-        
-        # Predict
-        prob = ML_MODEL.predict_proba(input_data)[0][1] # Probability of delay
-        
-        # Determine Risk Level
-        if prob > 0.6:
-            risk_level = "High"
-        elif prob > 0.3:
-            risk_level = "Medium"
-        else:
-            risk_level = "Low"
-            
-        return {
-            'probability': round(prob * 100, 1),
-            'risk_level': risk_level,
-            'is_peak': is_peak_hour(hour),
-            'is_international': is_international_route(origin, destination)
-        }
+
+        cache_key = PREDICTION_CACHE.key(bundle, origin, destination, airline, current_time)
+        prob = PREDICTION_CACHE.get(cache_key)
+        if prob is None and bundle.risk_table:
+            prob = bundle.risk_table.lookup(origin, destination, airline, current_time)
+        degraded = None
+        if prob is None:
+            input_data = bundle.feature_encoder.encode(origin, destination, airline, current_time).reshape(1, -1)
+
+            # Predict
+            result = score(input_data, bundle=bundle)
+            prob = result['probability'][0] # Probability of delay
+            degraded = result.get('degraded')
+            if not degraded:
+                PREDICTION_CACHE.put(cache_key, prob)
+
+        return _format_risk_result(prob, origin, destination, current_time.hour, bundle, degraded)
 
     except Exception as e:
         print(f"Risk calc error: {e}")
         return {'error': str(e)}
+
+def _risk_probabilities(flights, bundle):
+    """
+    Delay probability of every flight dict (departure_time already filled in), plus the
+    degraded reason per row (None for real model answers). Rows not in PREDICTION_CACHE
+    (or the risk table) are encoded together and scored with a single model call.
+    """
+    probs = np.full(len(flights), np.nan)
+    degraded = np.full(len(flights), None, dtype=object)
+    keys = [PREDICTION_CACHE.key(bundle, f['origin'], f['destination'], f.get('airline', 'MH'), f['departure_time'])
+            for f in flights]
+    for i, (f, key) in enumerate(zip(flights, keys)):
+        prob = PREDICTION_CACHE.get(key)
+        if prob is None and bundle.risk_table:
+            prob = bundle.risk_table.lookup(f['origin'], f['destination'], f.get('airline', 'MH'), f['departure_time'])
+        if prob is not None:
+            probs[i] = prob
+
+    # Live-score whatever the table couldn't answer, still in a single call
+    missing = np.flatnonzero(np.isnan(probs))
+    if len(missing):
+        input_data = bundle.feature_encoder.encode_many([flights[i] for i in missing])
+        result = score(input_data, bundle=bundle)
+        probs[missing] = result['probability']
+        if result.get('degraded'):
+            degraded[missing] = result['degraded']
+        else:
+            for i in missing:
+                PREDICTION_CACHE.put(keys[i], probs[i])
+    return probs, degraded
+
+def calculate_flight_risk_batch(flights, bundle=None):
+    """
+    Vectorized version of calculate_flight_risk.
+    `flights` is a sequence of dicts with 'origin', 'destination', 'departure_time'
+    and 'airline' keys. Returns a list of results in the same order as `flights`.
+    """
+    flights = list(flights)
+    if not flights:
+        return []
+
+    bundle = bundle or REGISTRY.current()
+    if bundle is None:
+        return [{'error': 'Model not loaded'} for _ in flights]
+
+    now = datetime.now()
+    flights = [{**f, 'departure_time': f.get('departure_time') or now} for f in flights]
+
+    try:
+        probs, degraded = _risk_probabilities(flights, bundle)
+    except Exception as e:
+        # One bad row shouldn't take the whole batch down, score them one by one instead
+        print(f"Batch risk calc error, falling back to per-flight scoring: {e}")
+        return [
+            calculate_flight_risk(f['origin'], f['destination'], f['departure_time'], f.get('airline', 'MH'), bundle=bundle)
+            for f in flights
+        ]
+
+    return [
+        _format_risk_result(prob, f['origin'], f['destination'], f['departure_time'].hour, bundle, reason)
+        for prob, f, reason in zip(probs, flights, degraded)
+    ]
+
+# Risk snapshot columns on TrackedFlight, for save(update_fields=...) / bulk_update
+RISK_SNAPSHOT_FIELDS = ['risk_probability', 'risk_level', 'risk_model_version', 'risk_scored_at']
+
+def snapshot_flight_risk(flights, bundle=None, scored_at=None):
+    """
+    Scores TrackedFlight objects in one batch and sets their RISK_SNAPSHOT_FIELDS
+    (nothing is saved). Flights without a route, and degraded answers, are left as
+    they were so the next rescore picks them up. Returns the flights that were updated.
+    """
+    bundle = bundle or REGISTRY.current()
+    scoreable = [f for f in flights if f.origin and f.destination]
+    if bundle is None or not scoreable:
+        return []
+
+    scored_at = scored_at or timezone.now()
+    probs, degraded = _risk_probabilities([
+        {'origin': f.origin, 'destination': f.destination, 'airline': f.airline,
+         'departure_time': f.departureTime or scored_at}
+        for f in scoreable
+    ], bundle)
+
+    updated = []
+    for flight, prob, reason in zip(scoreable, probs, degraded):
+        if reason:
+            continue
+        flight.risk_probability = float(prob)
+        flight.risk_level = get_risk_level(prob)
+        flight.risk_model_version = bundle.version
+        flight.risk_scored_at = scored_at
+        updated.append(flight)
+    return updated
@@ -0,0 +1,142 @@
+"""
+Single-file model bundle written by the training scripts and read by ml_utils.
+
+The bundle is an uncompressed zip holding:
+    manifest.json - format, version, feature names, category vocabularies, metrics
+                    and the sha256 of every other member
+    model.txt     - the LightGBM model in its native text format
+    trees.npz     - the same trees flattened for TreeEvaluator (no dump_model() parse at load)
+
+It is written to a temporary file next to the target and renamed over it, so readers
+see either the old bundle or the new one, never a half written or mismatched set.
+Nothing in here imports Django, the training scripts use it directly.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+from .tree_evaluator import TreeEvaluator
+
+BUNDLE_FORMAT = 'neurasky-model-bundle'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_FILENAME = 'flight_delay_model.bundle'
+
+
+class BundleError(ValueError):
+    """The bundle is missing, truncated, tampered with or in an unknown format."""
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _json_default(value):
+    # Metrics come out of sklearn/pandas with numpy scalars in them
+    if hasattr(value, 'item'):
+        return value.item()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def _content_hash(manifest):
+    """Hash over everything in the manifest except the hash/version fields themselves."""
+    content = {k: v for k, v in manifest.items() if k not in ('content_sha256', 'model_version')}
+    return _sha256(json.dumps(content, sort_keys=True, default=_json_default).encode())
+
+
+def write_bundle(path, booster, feature_names, vocabularies, metrics=None):
+    """
+    Writes `booster` (a trained lightgbm.Booster), the feature order, the category
+    vocabularies ({column: [category, ...]}, code = position) and the training metrics
+    to `path` atomically. Returns the manifest.
+    """
+    num_iteration = booster.best_iteration if booster.best_iteration > 0 else None
+    model_text = booster.model_to_string(num_iteration=num_iteration).encode()
+
+    trees = io.BytesIO()
+    np.savez(trees, **TreeEvaluator.from_booster(booster, num_iteration=num_iteration).to_arrays())
+    members = {'model.txt': model_text, 'trees.npz': trees.getvalue()}
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'feature_names': list(feature_names),
+        'vocabularies': {str(column): [str(c) for c in categories] for column, categories in vocabularies.items()},
+        'metrics': json.loads(json.dumps(metrics or {}, default=_json_default)),
+        'files': {name: {'sha256': _sha256(data), 'bytes': len(data)} for name, data in members.items()},
+    }
+    manifest['content_sha256'] = _content_hash(manifest)
+    manifest['model_version'] = manifest['content_sha256'][:12]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.bundle-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_STORED) as bundle:
+                bundle.writestr('manifest.json', json.dumps(manifest, indent=2, sort_keys=True))
+                for name, data in members.items():
+                    bundle.writestr(name, data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file owner-only, the server may run as another user
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return manifest
+
+
+def read_bundle(path):
+    """
+    Verifies and loads a bundle. Returns a dict with 'manifest', 'model_version',
+    'booster', 'evaluator', 'feature_names', 'vocabularies' and 'metrics'.
+    Raises BundleError if anything doesn't match the manifest.
+    """
+    import lightgbm as lgb
+
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            manifest = json.loads(bundle.read('manifest.json'))
+            if manifest.get('format') != BUNDLE_FORMAT or manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+                raise BundleError(f"Unsupported bundle format {manifest.get('format')} v{manifest.get('format_version')}")
+            members = {name: bundle.read(name) for name in manifest['files']}
+    except (OSError, KeyError, zipfile.BadZipFile, json.JSONDecodeError) as e:
+        raise BundleError(f"Unreadable model bundle {path}: {e}") from e
+
+    for name, data in members.items():
+        if _sha256(data) != manifest['files'][name]['sha256']:
+            raise BundleError(f"Checksum mismatch for {name} in {path}")
+    if _content_hash(manifest) != manifest.get('content_sha256'):
+        raise BundleError(f"Manifest checksum mismatch in {path}")
+
+    with np.load(io.BytesIO(members['trees.npz'])) as arrays:
+        evaluator = TreeEvaluator.from_arrays(arrays, feature_names=manifest['feature_names'])
+
+    return {
+        'manifest': manifest,
+        'model_version': manifest['model_version'],
+        'booster': lgb.Booster(model_str=members['model.txt'].decode()),
+        'evaluator': evaluator,
+        'feature_names': manifest['feature_names'],
+        'vocabularies': manifest['vocabularies'],
+        'metrics': manifest['metrics'],
+    }
+
+
+def vocabularies_from_encoder(encoder):
+    """{column: categories} from a fitted sklearn OrdinalEncoder, in code order."""
+    return {
+        str(column): [str(c) for c in categories]
+        for column, categories in zip(encoder.feature_names_in_, encoder.categories_)
+    }
@@ -1,7 +1,10 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, events
 
 # Stores flights saved by users from the 'MyFlights.jsx' page
 class TrackedFlight(models.Model):
@@ -14,6 +17,11 @@ class TrackedFlight(models.Model):
     departureTime = models.DateTimeField(null=True, blank=True)
     arrivalTime = models.DateTimeField(null=True, blank=True)
     airline = models.CharField(max_length=100, null=True, blank=True)
+    # airline holds the full name, looked up from the flight number's code
+    AIRLINES = {
+        'MH': 'Malaysia Airlines', 'AK': 'AirAsia', 'OD': 'Batik Air',
+        'SQ': 'Singapore Airlines', 'CX': 'Cathay Pacific', 'JL': 'Japan Airlines'
+    }
     
     origin = models.CharField(max_length=10, null=True, blank=True)
     destination = models.CharField(max_length=10, null=True, blank=True)
@@ -26,8 +34,19 @@ class TrackedFlight(models.Model):
     baggage_claim = models.CharField(max_length=10, null=True, blank=True)
     aircraft_type = models.CharField(max_length=50, null=True, blank=True)
 
+    # Delay risk at the last scoring (on create, then `manage.py rescore_flights` after a model change)
+    RISK_LEVELS = [('Low', 'Low'), ('Medium', 'Medium'), ('High', 'High')]
+    risk_probability = models.FloatField(null=True, blank=True)
+    risk_level = models.CharField(max_length=10, choices=RISK_LEVELS, null=True, blank=True)
+    risk_model_version = models.CharField(max_length=64, null=True, blank=True)
+    risk_scored_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         return f"{self.user.username} - {self.flight_number} on {self.date}"
+
+    class Meta:
+        # Hot filters, plans checked by QueryPlanTests
+        indexes = [models.Index(fields=['user', 'departureTime'], name='tracked_user_departure_idx')]  # stats, digest
     
 # Stores historical data for analytics
 class FlightHistory(models.Model):
@@ -38,10 +57,47 @@ class FlightHistory(models.Model):
 
     # CHANGED: Removed auto_now_add=True to allow importing historical data
     recorded_at = models.DateTimeField()
+    # Natural key of rows from `manage.py import_flight_history` (date|airline|number|route|time), for dedupe
+    import_key = models.CharField(max_length=64, null=True, blank=True, unique=True, editable=False)
 
     def __str__(self):
         return f"{self.flight_number} on {self.recorded_at.date()} - Status: {self.status}"
+
+    class Meta:
+        # Date ranges, and the raw aggregates of rebuild_rollups --check
+        indexes = [
+            models.Index(fields=['recorded_at'], name='history_recorded_at_idx'),
+            models.Index(fields=['status'], name='history_status_idx'),
+            models.Index(fields=['delay_minutes'], name='history_delay_idx'),
+        ]
     
+# Pre-aggregated FlightHistory for the analytics views, kept current by api/rollups.py
+class FlightHistoryRollup(models.Model):
+    DELAY_BUCKETS = [('on_time', 'On-Time'), ('1-30', '1-30 min'), ('30-60', '30-60 min'), ('60+', '60+ min')]
+    airline = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=50)
+    delay_bucket = models.CharField(max_length=10, choices=DELAY_BUCKETS)
+    flights = models.BigIntegerField(default=0)
+    delay_minutes_total = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class FlightHistoryDaily(FlightHistoryRollup):
+    day = models.DateField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'airline', 'status', 'delay_bucket'],
+                                               name='unique_flight_history_daily')]
+
+class FlightHistoryMonthly(FlightHistoryRollup):
+    # First day of the month
+    month = models.DateField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['month', 'airline', 'status', 'delay_bucket'],
+                                               name='unique_flight_history_monthly')]
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     emailNotifications = models.BooleanField(default=True)
@@ -79,4 +135,88 @@ class Alert(models.Model):
         return f"{self.user.username} - {self.title}"
     
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', 'read'], name='alert_user_read_idx'),  # unread counts, mark all read
+            models.Index(fields=['user', 'timestamp'], name='alert_user_timestamp_idx'),  # alert lists, digest
+            # The alert engine's "already alerted about this flight" check
+            models.Index(fields=['user', 'flightNumber', 'type', 'timestamp'], name='alert_user_flight_type_idx'),
+        ]
+
+# Outgoing email waiting for `manage.py send_queued_mail` (api/mailer.py)
+class OutboundEmail(models.Model):
+    STATUSES = [('queued', 'Queued'), ('sent', 'Sent'), ('dead', 'Dead')]
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    # Queued mail is picked up once this has passed (retry backoff, or a worker's claim)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+# Progress of a batch job run (e.g. `weekly_digest:2025-W07`), lets an interrupted run resume
+class JobCheckpoint(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} (last id {self.last_id}{', finished' if self.finished_at else ''})"
+
+# Cached responses built from these models (api/caching.py)
+@receiver([post_save, post_delete], sender=TrackedFlight)
+def invalidate_tracked_flights_cache(sender, instance, **kwargs):
+    caching.invalidate('tracked_flights', scope=instance.user_id)
+    caching.invalidate('flight_stats', scope=instance.user_id)
+
+@receiver([post_save, post_delete], sender=Alert)
+def invalidate_alert_stats_cache(sender, instance, **kwargs):
+    caching.invalidate('flight_stats', scope=instance.user_id)
+
+# Flight changes for the user's /api/events/ streams (api/streams.py)
+@receiver([post_save, post_delete], sender=TrackedFlight)
+def publish_flight_event(sender, instance, signal, **kwargs):
+    events.publish_to_user(instance.user_id, 'flight', {
+        'id': instance.id,
+        'flight_number': instance.flight_number,
+        'status': instance.status,
+        'estimatedDelay': instance.estimatedDelay,
+        'risk_level': instance.risk_level,
+        'deleted': signal is post_delete,
+    })
+
+@receiver([post_save, post_delete], sender=FlightHistory)
+def invalidate_analytics_cache(sender, instance, **kwargs):
+    caching.invalidate('analytics')
+
+# Keep the rollups in step with single-row writes, bulk writes call rollups.apply() themselves
+@receiver(pre_save, sender=FlightHistory)
+def remember_rollup_row(sender, instance, **kwargs):
+    if not instance._state.adding and instance.pk:
+        instance._rollup_previous = FlightHistory.objects.filter(pk=instance.pk).first()
+
+@receiver(post_save, sender=FlightHistory)
+def update_rollups_on_save(sender, instance, created, **kwargs):
+    from . import rollups
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous is not None:
+        rollups.apply([previous], sign=-1)
+    rollups.apply([instance])
+
+@receiver(post_delete, sender=FlightHistory)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    from . import rollups
+    rollups.apply([instance], sign=-1)
@@ -0,0 +1,198 @@
+"""
+FlightHistory rolled up per day and per month by airline x status x delay bucket, so the
+analytics views read a few hundred rows however long the history gets.
+
+    apply(rows)     - adds FlightHistory rows to the rollups (sign=-1 takes them out).
+                      Single saves/deletes go through the signals in models.py, code that
+                      bulk_creates history must call it itself, in the same transaction
+                      (`manage.py import_flight_history` does)
+    rebuild()       - recomputes everything from FlightHistory in pk chunks
+                      (`manage.py rebuild_rollups`, migration 0011 has a frozen copy)
+    check()         - compares the rollups with the same aggregates run on the raw table
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+def delay_bucket(delay_minutes):
+    # Same ranges as the old DelayDurationView counts (FlightHistoryRollup.DELAY_BUCKETS)
+    delay_minutes = delay_minutes or 0
+    if delay_minutes <= 0:
+        return 'on_time'
+    if delay_minutes <= 30:
+        return '1-30'
+    if delay_minutes <= 60:
+        return '30-60'
+    return '60+'
+
+
+def tally(rows, totals=None):
+    """
+    Sums (airline, status, delay_minutes, recorded_at) tuples into
+    {('day' | 'month', date, airline, status, bucket): [flights, delay minutes]}.
+    """
+    totals = totals if totals is not None else defaultdict(lambda: [0, 0])
+    # Local dates, like TruncMonth in the views used to. Looked up once, timezone.localtime()
+    # per row was a good part of a bulk import
+    tz = timezone.get_current_timezone()
+    for airline, status, delay_minutes, recorded_at in rows:
+        day = recorded_at.astimezone(tz).date() if recorded_at.tzinfo is not None else recorded_at.date()
+        key = (airline or '', status, delay_bucket(delay_minutes))
+        for level, period in (('day', day), ('month', day.replace(day=1))):
+            total = totals[(level, period) + key]
+            total[0] += 1
+            total[1] += delay_minutes or 0
+    return totals
+
+
+def _models():
+    from .models import FlightHistory, FlightHistoryDaily, FlightHistoryMonthly
+    return FlightHistory, FlightHistoryDaily, FlightHistoryMonthly
+
+
+# Above this many buckets apply() writes in bulk instead of one UPDATE per bucket
+BULK_APPLY_AT = 50
+
+
+def apply(histories, sign=1):
+    """
+    Adds (or with sign=-1 removes) FlightHistory objects. One or two queries per distinct
+    bucket, or a handful per table for big batches (_apply_bulk).
+    """
+    _, daily, monthly = _models()
+    totals = tally((h.airline, h.status, h.delay_minutes, h.recorded_at) for h in histories)
+    with transaction.atomic():
+        if len(totals) >= BULK_APPLY_AT:
+            _apply_bulk(totals, sign)
+            return
+        for (level, period, airline, status, bucket), (flights, minutes) in totals.items():
+            model, period_field = (daily, 'day') if level == 'day' else (monthly, 'month')
+            _apply_one(model, period_field, (period, airline, status, bucket), sign * flights, sign * minutes)
+
+
+def _apply_one(model, period_field, bucket_key, flights, minutes):
+    period, airline, status, bucket = bucket_key
+    key = {period_field: period, 'airline': airline, 'status': status, 'delay_bucket': bucket}
+    changes = {'flights': F('flights') + flights, 'delay_minutes_total': F('delay_minutes_total') + minutes}
+    if model.objects.filter(**key).update(**changes) or flights < 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, flights=flights, delay_minutes_total=minutes)
+    except IntegrityError:
+        # Another writer created the bucket first
+        model.objects.filter(**key).update(**changes)
+
+
+def _apply_bulk(totals, sign):
+    """
+    A bulk import touches thousands of buckets per chunk (a year of days x airlines x statuses).
+    Per table: one query for the buckets that exist, one executemany of increments, one bulk_create.
+    """
+    _, daily, monthly = _models()
+    qn = connection.ops.quote_name
+    for model, level, period_field in ((daily, 'day', 'day'), (monthly, 'month', 'month')):
+        wanted = {key[1:]: value for key, value in totals.items() if key[0] == level}
+        if not wanted:
+            continue
+        periods = sorted({period for period, *_ in wanted})
+        existing = set()
+        for i in range(0, len(periods), 500):
+            existing.update(model.objects.filter(**{f'{period_field}__in': periods[i:i + 500]})
+                            .values_list(period_field, 'airline', 'status', 'delay_bucket'))
+
+        # Increments rather than read-modify-write, so concurrent single-row applies aren't lost
+        period_column = model._meta.get_field(period_field)
+        sql = (f"UPDATE {qn(model._meta.db_table)} SET {qn('flights')} = {qn('flights')} + %s, "
+               f"{qn('delay_minutes_total')} = {qn('delay_minutes_total')} + %s "
+               f"WHERE {qn(period_column.column)} = %s AND {qn('airline')} = %s AND {qn('status')} = %s "
+               f"AND {qn('delay_bucket')} = %s")
+        rows = [[sign * flights, sign * minutes, period_column.get_db_prep_value(period, connection), airline, status, bucket]
+                for (period, airline, status, bucket), (flights, minutes) in wanted.items()
+                if (period, airline, status, bucket) in existing]
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+        missing = [key for key in wanted if key not in existing]
+        if sign < 0 or not missing:
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([
+                    model(**{period_field: period}, airline=airline, status=status, delay_bucket=bucket,
+                          flights=wanted[period, airline, status, bucket][0],
+                          delay_minutes_total=wanted[period, airline, status, bucket][1])
+                    for period, airline, status, bucket in missing
+                ], batch_size=1000)
+        except IntegrityError:
+            # Someone created some of them meanwhile, take the careful path for these
+            for key in missing:
+                _apply_one(model, period_field, key, *wanted[key])
+
+
+def rebuild(chunk_size=5000):
+    """Recomputes both rollup tables from FlightHistory. Returns the number of history rows read."""
+    history, daily, monthly = _models()
+    totals = defaultdict(lambda: [0, 0])
+    last_pk = seen = 0
+    while True:
+        chunk = list(history.objects.filter(pk__gt=last_pk).order_by('pk')
+                     .values_list('pk', 'airline', 'status', 'delay_minutes', 'recorded_at')[:chunk_size])
+        if not chunk:
+            break
+        tally((row[1:] for row in chunk), totals)
+        last_pk = chunk[-1][0]
+        seen += len(chunk)
+
+    with transaction.atomic():
+        daily.objects.all().delete()
+        monthly.objects.all().delete()
+        for model, level, period_field in ((daily, 'day', 'day'), (monthly, 'month', 'month')):
+            model.objects.bulk_create([
+                model(**{period_field: period}, airline=airline, status=status, delay_bucket=bucket,
+                      flights=flights, delay_minutes_total=minutes)
+                for (row_level, period, airline, status, bucket), (flights, minutes) in totals.items()
+                if row_level == level
+            ], batch_size=1000)
+    return seen
+
+
+def check():
+    """Differences between the rollups and the raw FlightHistory aggregates, [] when they agree."""
+    history, daily, monthly = _models()
+    problems = []
+
+    def compare(name, raw, rolled):
+        for key in sorted(set(raw) | set(rolled), key=str):
+            if raw.get(key) != rolled.get(key):
+                problems.append(f"{name} {key}: raw {raw.get(key)}, rollup {rolled.get(key)}")
+
+    compare('status',
+            dict(history.objects.values_list('status').annotate(n=Count('id')).order_by()),
+            {s: n for s, n in monthly.objects.values_list('status').annotate(n=Sum('flights')).order_by() if n})
+
+    raw_buckets = defaultdict(int)
+    for delay_minutes, n in history.objects.values_list('delay_minutes').annotate(n=Count('id')).order_by():
+        raw_buckets[delay_bucket(delay_minutes)] += n
+    compare('delay bucket', dict(raw_buckets),
+            {b: n for b, n in monthly.objects.values_list('delay_bucket').annotate(n=Sum('flights')).order_by() if n})
+
+    raw_months = {
+        row['month'].date() if hasattr(row['month'], 'date') else row['month']: (row['n'], row['minutes'])
+        for row in history.objects.annotate(month=TruncMonth('recorded_at')).values('month')
+        .annotate(n=Count('id'), minutes=Sum('delay_minutes')).order_by()
+    }
+    compare('month', raw_months, {
+        row['month']: (row['n'], row['minutes'])
+        for row in monthly.objects.values('month').annotate(n=Sum('flights'), minutes=Sum('delay_minutes_total')).order_by()
+        if row['n']
+    })
+
+    day_totals = daily.objects.aggregate(n=Sum('flights'), minutes=Sum('delay_minutes_total'))
+    month_totals = monthly.objects.aggregate(n=Sum('flights'), minutes=Sum('delay_minutes_total'))
+    compare('daily vs monthly', {'totals': day_totals}, {'totals': month_totals})
+    return problems
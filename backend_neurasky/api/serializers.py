@@ -3,6 +3,7 @@ from rest_framework import serializers
 from .models import TrackedFlight, UserProfile, Alert
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import authenticate
+from django.db import models
 
 class UserProfileSettingsSerializer(serializers.ModelSerializer):
     class Meta:
@@ -55,7 +56,41 @@ class RegisterSerializer(serializers.ModelSerializer):
 
 # In api/serializers.py
 
-from .ml_utils import calculate_flight_risk
+from . import ml_utils
+from .ml_utils import calculate_flight_risk, calculate_flight_risk_batch, risk_result_from_snapshot
+
+class TrackedFlightListSerializer(serializers.ListSerializer):
+    """
+    Scores the risk of every flight in the list with one batched model call
+    instead of one call per row in TrackedFlightSerializer.get_risk_analysis.
+    """
+
+    def to_representation(self, data):
+        iterable = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+
+        # Flights scored by the serving model already have their risk stored
+        bundle = ml_utils.REGISTRY.current()
+        self.risk_analysis_cache = {}
+        for f in iterable:
+            if f.origin and f.destination:
+                snapshot = risk_result_from_snapshot(f, bundle)
+                if snapshot is not None:
+                    self.risk_analysis_cache[f.pk] = snapshot
+
+        scoreable = [f for f in iterable if f.origin and f.destination and f.pk not in self.risk_analysis_cache]
+        results = calculate_flight_risk_batch([
+            {
+                'origin': f.origin,
+                'destination': f.destination,
+                'departure_time': f.departureTime,
+                'airline': f.airline
+            }
+            for f in scoreable
+        ])
+        # Read back by the child serializer in get_risk_analysis
+        self.risk_analysis_cache.update({f.pk: result for f, result in zip(scoreable, results)})
+
+        return [self.child.to_representation(item) for item in iterable]
 
 class TrackedFlightSerializer(serializers.ModelSerializer):
     risk_analysis = serializers.SerializerMethodField()
@@ -86,12 +121,23 @@ class TrackedFlightSerializer(serializers.ModelSerializer):
         # We must also mark 'origin' and 'destination' as read-only,
         # just like the other fields populated by the server.
         read_only_fields = ('origin', 'destination', 'status', 'estimatedDelay', 'departureTime', 'arrivalTime', 'gate', 'terminal', 'baggage_claim', 'aircraft_type', 'airline')
+        list_serializer_class = TrackedFlightListSerializer
 
     def get_risk_analysis(self, obj):
         # Safe access to fields
         if not obj.origin or not obj.destination:
             return None
-            
+
+        # Already scored in bulk by TrackedFlightListSerializer
+        cache = getattr(self.parent, 'risk_analysis_cache', None)
+        if cache is not None and obj.pk in cache:
+            return cache[obj.pk]
+
+        snapshot = risk_result_from_snapshot(obj, ml_utils.REGISTRY.current())
+        if snapshot is not None:
+            return snapshot
+
+
         return calculate_flight_risk(
             origin=obj.origin,
             destination=obj.destination,
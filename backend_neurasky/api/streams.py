@@ -0,0 +1,96 @@
+"""
+GET /api/events/ - Server-Sent Events stream of the user's alerts and tracked flight changes.
+
+Plain async Django view, serve it through neurasky_backend/asgi.py (uvicorn). Under the
+WSGI server a stream would hold a whole worker thread for as long as it's open.
+
+EventSource can't send an Authorization header, so the JWT access token may also come
+as ?token=. It's checked once when the stream opens, with the same rules as the rest of
+the API (one query: the user has to exist and be active), not again while it's open.
+
+    event: alert     data: {alert fields}      id: <alert id>
+    event: flight    data: {id, flight_number, status, estimatedDelay, risk_level, deleted}
+    event: resync    the client fell too far behind, refetch /api/alerts/new/ and /api/flights/
+
+On reconnect the browser sends Last-Event-ID (or pass ?since=<alert id>) and the alerts
+created in the meantime are replayed first.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import events
+from .models import Alert
+
+
+def format_event(kind, data, event_id=None):
+    lines = [f'event: {kind}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def user_from_request(request):
+    """The active user the request's access token belongs to, or None. Hits the database."""
+    token = request.GET.get('token')
+    header = request.headers.get('Authorization', '')
+    if not token and header.startswith('Bearer '):
+        token = header[len('Bearer '):]
+    if not token:
+        return None
+    try:
+        return JWTAuthentication().get_user(AccessToken(token))
+    except (TokenError, InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _missed_alerts(user_id, since_id):
+    return list(Alert.objects.filter(user_id=user_id, id__gt=since_id).order_by('id')[:100])
+
+
+async def _stream(user_id, since_id):
+    broker = events.get_broker()
+    # Subscribe before replaying, so nothing created in between is missed (the client dedupes by id)
+    subscription = broker.subscribe(events.user_channel(user_id))
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT', 25)
+    try:
+        yield 'retry: 5000\n\n'
+        if since_id is not None:
+            for alert in await sync_to_async(_missed_alerts)(user_id, since_id):
+                yield format_event('alert', events.alert_event_data(alert), alert.id)
+        while True:
+            event = await subscription.get(timeout=heartbeat)
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield format_event('resync', {})
+            if event is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield format_event(event['type'], event['data'], event.get('id'))
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def event_stream(request):
+    user = await sync_to_async(user_from_request)(request)
+    if user is None:
+        return JsonResponse({'error': 'A valid access token is required'}, status=401)
+
+    since = request.GET.get('since') or request.headers.get('Last-Event-ID')
+    try:
+        since_id = int(since) if since else None
+    except ValueError:
+        return JsonResponse({'error': 'since must be an alert id'}, status=400)
+
+    response = StreamingHttpResponse(_stream(user.pk, since_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import streams, views
 
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -38,14 +38,18 @@ urlpatterns = [
     path('predict/', 
         views.predict_delay, 
         name='predict-flight'),
+    path('predict/batch/', views.predict_delay_batch, name='predict-flight-batch'),
     
     path('model-info/', 
         views.model_info, 
         name='model-info'),
+    path('model/reload/', views.reload_model, name='model-reload'),
 
     # Alert system
     path('alerts/', views.get_all_alerts, name='get-all-alerts'),
     path('alerts/new/', views.get_new_alerts, name='get-new-alerts'),
+    # Push alternative to polling the two above, served by the ASGI app
+    path('events/', streams.event_stream, name='event-stream'),
     path('alerts/mark-read/', views.mark_alert_read, name='mark-alert-read'),
     path('alerts/mark-all-read/', views.mark_all_alerts_read, name='mark-all-alerts-read'),
     path('alerts/delete/', views.delete_alert, name='delete-alert'),
@@ -55,4 +59,8 @@ urlpatterns = [
     path('analytics/delay-durations/', views.DelayDurationView.as_view(), name='delay-durations'),
     path('analytics/historical-trends/', views.HistoricalTrendsView.as_view(), name='historical-trends'),
     path('analytics/route-forecast/', views.RouteForecastView.as_view(), name='route-forecast'),
+
+    # Streaming downloads (api/exports.py), route /api/exports/ to the ASGI server with /api/events/
+    path('exports/flight-history/', views.FlightHistoryExportView.as_view(), name='export-flight-history'),
+    path('exports/tracked-flights/', views.TrackedFlightExportView.as_view(), name='export-tracked-flights'),
 ]
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Idle load on the /api/events/ stream: opens N Server-Sent Events connections against one
+uvicorn process running neurasky_backend.asgi, holds them open, and reports what the
+server process pays for them (memory, CPU while idle, heartbeats included).
+
+    python benchmark_event_stream.py --settings neurasky_backend.test_settings --connections 10000
+
+Linux only (reads /proc). Raise `ulimit -n` above the connection count first. The database
+of --settings has to be migrated, a throwaway user is created per connection.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import django
+
+
+def proc_stats(pid):
+    """(cpu seconds, rss MB) of a process."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    with open(f'/proc/{pid}/status') as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+    return cpu, rss / 1024
+
+
+async def open_stream(port, token):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET /api/events/?token={token} HTTP/1.1\r\nHost: localhost\r\n'
+                 f'Accept: text/event-stream\r\n\r\n'.encode())
+    await writer.drain()
+    headers = await reader.readuntil(b'\r\n\r\n')
+    if b' 200 ' not in headers.split(b'\r\n', 1)[0]:
+        raise RuntimeError(headers.decode())
+    await reader.readuntil(b'retry: 5000')
+    return reader, writer
+
+
+async def drain(reader, counts):
+    # Keep reading so heartbeats don't pile up in the socket buffers
+    while await reader.read(4096):
+        counts['reads'] += 1
+
+
+async def run(args, tokens, pid):
+    base_cpu, base_rss = proc_stats(pid)
+    started = time.perf_counter()
+    streams = []
+    for i in range(0, len(tokens), args.connect_batch):
+        streams += await asyncio.gather(*(open_stream(args.port, t) for t in tokens[i:i + args.connect_batch]))
+    connect_time = time.perf_counter() - started
+    open_cpu, open_rss = proc_stats(pid)
+
+    counts = {'reads': 0}
+    readers = [asyncio.ensure_future(drain(reader, counts)) for reader, _ in streams]
+    await asyncio.sleep(args.duration)
+    idle_cpu, idle_rss = proc_stats(pid)
+
+    for task in readers:
+        task.cancel()
+    for _, writer in streams:
+        writer.close()
+
+    n = len(streams)
+    print(f"⏱️  {n:,} idle SSE connections on one uvicorn process (heartbeat every {args.heartbeat}s)")
+    print(f"   connect   {connect_time:.1f}s ({n / connect_time:,.0f} conn/s), {open_cpu - base_cpu:.1f}s server CPU")
+    print(f"   memory    {base_rss:.0f} MB -> {idle_rss:.0f} MB, "
+          f"{(idle_rss - base_rss) * 1024 / n:.1f} KB per connection")
+    print(f"   idle      {(idle_cpu - open_cpu) / args.duration * 100:.1f}% of one core over {args.duration:.0f}s, "
+          f"{counts['reads']:,} reads by the clients")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server cost of idle /api/events/ subscribers')
+    parser.add_argument('--settings', default='neurasky_backend.settings')
+    parser.add_argument('--connections', type=int, default=10000)
+    parser.add_argument('--connect-batch', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to hold the connections idle')
+    parser.add_argument('--heartbeat', type=int, default=25)
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': args.settings, 'EVENTS_HEARTBEAT': str(args.heartbeat)}
+    env.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.update(DJANGO_SETTINGS_MODULE=args.settings, SECRET_KEY=env['SECRET_KEY'])
+    sys.path.insert(0, here)
+    django.setup()
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    # One subscriber per user. The stream checks the user exists and is active when it
+    # opens, so they're created here (and removed afterwards)
+    names = [f'sse-benchmark-{i}' for i in range(args.connections)]
+    existing = set(User.objects.filter(username__in=names).values_list('username', flat=True))
+    User.objects.bulk_create([User(username=name) for name in names if name not in existing], batch_size=1000)
+    users = User.objects.filter(username__in=names)
+    tokens = [str(AccessToken.for_user(user)) for user in users]
+
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'neurasky_backend.asgi:application',
+                               '--port', str(args.port), '--no-access-log', '--backlog', '4096'],
+                              cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        import urllib.request
+        deadline = time.time() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{args.port}/api/health/', timeout=1).read()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+        asyncio.run(run(args, tokens, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+        users.delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Mail queue throughput: N queued emails sent by mailer.send_queued(), one SMTP connection
+per batch, against the old way of one send_mail() (and one connection) per message.
+
+Runs against a throwaway test database and a minimal SMTP server on localhost, so no
+mail leaves the machine. Add --latency to give every SMTP reply a delay, which is
+closer to a real relay than localhost.
+
+    python benchmark_mail_queue.py --settings neurasky_backend.test_settings --messages 1000
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+
+import django
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Accepts every message and throws it away."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.latency = latency
+        self.connections = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 sink ready')
+        for line in self.rfile:
+            verb = line[:4].decode().upper()
+            if verb == 'DATA':
+                self.reply('354 go ahead')
+                for _ in iter(self.rfile.readline, b'.\r\n'):
+                    pass
+                self.reply('250 queued')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+def run(args, sink):
+    from django.core.mail import send_mail
+    from api import mailer
+
+    addresses = [f'user{i}@example.com' for i in range(args.messages)]
+    mailer.enqueue(mailer.build_message(to, f'Hello {to}', 'plain', html='<p>html</p>') for to in addresses)
+    started = time.perf_counter()
+    counts = {'sent': 0}
+    while True:
+        batch = mailer.send_queued(batch_size=args.batch_size, limiter=mailer.RateLimiter(0))
+        if not sum(batch.values()):
+            break
+        counts['sent'] += batch['sent']
+    queued = time.perf_counter() - started
+    queued_connections, sink.connections = sink.connections, 0
+
+    started = time.perf_counter()
+    for to in addresses:
+        send_mail(f'Hello {to}', 'plain', None, [to], html_message='<p>html</p>')
+    inline = time.perf_counter() - started
+
+    n = args.messages
+    print(f"📧 {n:,} emails, {args.latency * 1000:.0f} ms per SMTP reply")
+    print(f"   queue     {queued:.2f}s ({counts['sent'] / queued:,.0f} msg/s), {queued_connections} connections")
+    print(f"   inline    {inline:.2f}s ({n / inline:,.0f} msg/s), {sink.connections} connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mail queue vs one connection per message')
+    parser.add_argument('--settings', default='neurasky_backend.test_settings')
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the SMTP server waits before each reply')
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    django.setup()
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    sink = SMTPSink(args.latency)
+    database = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                               EMAIL_HOST='127.0.0.1', EMAIL_PORT=sink.server_address[1], EMAIL_USE_TLS=False,
+                               EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD=''):
+            run(args, sink)
+    finally:
+        connection.creation.destroy_test_db(database, verbosity=0)
+        sink.shutdown()
+        sink.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Mixed load benchmark: latency of a cheap endpoint (/api/health/) while other clients
+keep the workers busy with scoring (/api/predict/batch/).
+
+Starts gunicorn from gunicorn.conf.py on a spare port, optionally with the inference
+pool (`manage.py run_inference_pool`) so scoring leaves the web workers, and reports
+the health check's p50/p99 plus scoring throughput and degraded answers.
+
+    python benchmark_mixed_load.py --settings neurasky_backend.test_settings
+    python benchmark_mixed_load.py --settings neurasky_backend.test_settings --pool
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROUTES = [('KUL', 'PEN'), ('KUL', 'SIN'), ('KUL', 'LHR'), ('PEN', 'BKI'), ('KUL', 'NRT')]
+
+
+def wait_for(url, timeout=60):
+    started = time.time()
+    while time.time() - started < timeout:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} didn't come up in {timeout}s")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Health check latency under scoring load')
+    parser.add_argument('--settings', default='neurasky_backend.settings')
+    parser.add_argument('--pool', action='store_true', help='Score in the inference pool instead of the web workers')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--pool-processes', type=int, default=2)
+    parser.add_argument('--heavy-clients', type=int, default=4, help='Clients posting batch predictions')
+    parser.add_argument('--batch-rows', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    socket_path = os.path.join(tempfile.mkdtemp(), 'inference.sock')
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': args.settings,
+           'GUNICORN_BIND': f'127.0.0.1:{args.port}', 'GUNICORN_WORKERS': str(args.workers),
+           'GUNICORN_MEMORY_REPORT_EVERY': '0', 'ML_INFERENCE_SOCKET': socket_path if args.pool else '',
+           'ML_INFERENCE_PROCESSES': str(args.pool_processes)}
+    env.setdefault('SECRET_KEY', 'benchmark')
+
+    processes = []
+    if args.pool:
+        processes.append(subprocess.Popen([sys.executable, 'manage.py', 'run_inference_pool'], cwd=here, env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        while not os.path.exists(socket_path):
+            time.sleep(0.2)
+    processes.append(subprocess.Popen([sys.executable, '-m', 'gunicorn', 'neurasky_backend.wsgi:application',
+                                       '-c', 'gunicorn.conf.py'], cwd=here, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    base = f'http://127.0.0.1:{args.port}/api'
+    try:
+        wait_for(f'{base}/health/')
+        flights = [{'origin': o, 'destination': d, 'airline': 'MH', 'departure_time': f'{h:02d}:30'}
+                   for h in range(24) for (o, d) in ROUTES]
+        body = '\n'.join(json.dumps(flights[i % len(flights)]) for i in range(args.batch_rows)).encode()
+
+        stop = time.time() + args.duration
+        health, scored, degraded = [], [0], [0]
+        lock = threading.Lock()
+
+        def heavy():
+            while time.time() < stop:
+                request = urllib.request.Request(f'{base}/predict/batch/', data=body,
+                                                 headers={'Content-Type': 'application/x-ndjson'})
+                lines = urllib.request.urlopen(request, timeout=120).read().splitlines()
+                summary = json.loads(lines[-1])['summary']
+                with lock:
+                    scored[0] += summary['predicted']
+                    degraded[0] += sum(1 for line in lines[:-1] if b'"degraded"' in line)
+
+        def probe():
+            while time.time() < stop:
+                started = time.perf_counter()
+                urllib.request.urlopen(f'{base}/health/', timeout=120).read()
+                health.append((time.perf_counter() - started) * 1000)
+                time.sleep(0.05)
+
+        threads = [threading.Thread(target=heavy) for _ in range(args.heavy_clients)] + [threading.Thread(target=probe)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        mode = f"inference pool ({args.pool_processes} processes)" if args.pool else 'in-process scoring'
+        print(f"⏱️  {mode}, {args.workers} web workers, {args.heavy_clients} batch clients x {args.batch_rows} rows")
+        print(f"   /api/health/  p50 {statistics.median(health):.1f} ms, p99 {percentile(health, 99):.1f} ms, "
+              f"max {max(health):.1f} ms over {len(health)} requests")
+        print(f"   scoring       {scored[0] / args.duration:,.0f} flights/s, {degraded[0]:,} degraded answers")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
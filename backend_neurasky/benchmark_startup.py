@@ -0,0 +1,66 @@
+"""
+Cold start benchmark for `manage.py check`.
+
+Every run is a fresh interpreter, so this is what migrate/check/shell pay on each
+invocation (the migrate step in entrypoint.sh included). Pass --compare with the
+path of another checkout (e.g. a `git worktree` of an older commit) to time both.
+
+    python benchmark_startup.py --runs 5
+    git worktree add /tmp/neurasky-before <commit> && \\
+        python benchmark_startup.py --compare /tmp/neurasky-before/backend_neurasky
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Reports which heavy libraries the command ended up importing
+PROBE = """
+import sys, django
+from django.core.management import call_command
+django.setup()
+call_command('check', verbosity=0)
+heavy = ['lightgbm', 'sklearn', 'pandas', 'reportlab', 'requests']
+print(','.join(name for name in heavy if name in sys.modules))
+"""
+
+
+def time_check(backend_dir, runs, settings_module):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+    env.setdefault('SECRET_KEY', 'benchmark')
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, 'manage.py', 'check'], cwd=backend_dir, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - started)
+
+    probe = subprocess.run([sys.executable, '-c', PROBE], cwd=backend_dir, env=env,
+                           capture_output=True, text=True, check=True)
+    imported = probe.stdout.strip().splitlines()[-1] if probe.stdout.strip() else ''
+    return timings, imported or 'none'
+
+
+def report(label, timings, imported):
+    print(f"{label}: median {statistics.median(timings):.2f}s, "
+          f"min {min(timings):.2f}s, max {max(timings):.2f}s over {len(timings)} runs")
+    print(f"   heavy modules imported: {imported}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time cold `manage.py check` runs')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settings', default='neurasky_backend.settings')
+    parser.add_argument('--compare', help='backend_neurasky directory of another checkout to time as "before"')
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    if args.compare:
+        report('⏱️  before', *time_check(args.compare, args.runs, args.settings))
+    report('⏱️  current', *time_check(here, args.runs, args.settings))
+
+
+if __name__ == '__main__':
+    main()
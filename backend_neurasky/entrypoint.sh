@@ -23,6 +23,33 @@ done
 echo "MySQL is up - executing migrations"
 python manage.py migrate
 
+if [ -n "$ML_INFERENCE_SOCKET" ]; then
+  # Scoring runs in its own processes, web workers fall back to estimates if it lags behind
+  echo "Starting inference pool on $ML_INFERENCE_SOCKET..."
+  python manage.py run_inference_pool &
+fi
+
+if [ "${ALERT_WORKER:-1}" != "0" ]; then
+  # Re-checks every tracked flight for delays (new delays, the 24h re-alert, alerts switched back on),
+  # set ALERT_WORKER=0 if it runs elsewhere
+  echo "Starting delay alert worker..."
+  python manage.py evaluate_alerts --loop &
+fi
+
+if [ "${MAIL_WORKER:-1}" != "0" ]; then
+  # Alerts only queue their emails, this sends them (set MAIL_WORKER=0 if it runs elsewhere)
+  echo "Starting mail queue worker..."
+  python manage.py send_queued_mail &
+fi
+
+if [ -n "$EVENTS_PORT" ]; then
+  # /api/events/ streams and /api/exports/ downloads are long-lived, they're served by the ASGI app instead
+  # of gunicorn's sync workers. Route both to this port, and set EVENTS_REDIS_URL so gunicorn/cron events reach it
+  echo "Starting event stream server on port $EVENTS_PORT..."
+  uvicorn neurasky_backend.asgi:application --host 0.0.0.0 --port "$EVENTS_PORT" --no-access-log &
+fi
+
 echo "Starting Gunicorn..."
-# Use a larger timeout (60s) to allow for model loading if needed
-exec gunicorn neurasky_backend.wsgi:application --bind 0.0.0.0:8000 --timeout 60 --workers 3
+# Settings live in gunicorn.conf.py: the master preloads and warms up the model once,
+# workers share it copy-on-write. Override with GUNICORN_WORKERS / GUNICORN_PRELOAD etc.
+exec gunicorn neurasky_backend.wsgi:application -c gunicorn.conf.py
@@ -0,0 +1,72 @@
+"""
+Gunicorn settings for the API (used by entrypoint.sh).
+
+With preload_app the master imports neurasky_backend.wsgi, which loads and warms up
+the ML model once (see ml_utils.warm_up). Workers are forked afterwards and share
+those pages copy-on-write instead of each unpickling their own copy.
+"""
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '3'))
+# More than one thread switches to the gthread worker, concurrent predictions in a worker
+# can then share model calls through the micro-batcher (ML_MICROBATCH_WINDOW_MS)
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+# Allow for model loading and warm-up in the master
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() in ('true', '1')
+
+# Log worker memory every N requests (0 turns it off), shared pages get copied as workers touch them
+MEMORY_REPORT_EVERY = int(os.getenv('GUNICORN_MEMORY_REPORT_EVERY', '1000'))
+
+# Keep the collector from compacting/touching objects while the master loads the model,
+# freed holes and gc header writes are what break copy-on-write sharing after fork.
+# Turned back on in when_ready, once the app is loaded.
+gc.disable()
+
+
+def memory_usage(pid='self'):
+    """RSS / PSS / shared / private memory of a process in MB, read from /proc (Linux only)."""
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+              'Private_Clean': 'private', 'Private_Dirty': 'private'}
+    usage = {'rss': 0.0, 'pss': 0.0, 'shared': 0.0, 'private': 0.0}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    usage[fields[key]] += int(value.split()[0]) / 1024
+    except OSError:
+        return None
+    return usage
+
+
+def format_memory(usage):
+    if usage is None:
+        return 'memory stats unavailable'
+    return (f"RSS {usage['rss']:.1f} MB, PSS {usage['pss']:.1f} MB, "
+            f"shared {usage['shared']:.1f} MB, private {usage['private']:.1f} MB")
+
+
+def when_ready(server):
+    # Runs in the master after preload, before the first worker is forked. Freeze what's
+    # loaded so neither the master's collector nor the workers' ever walk it, then collect
+    # again as usual, the master runs for the life of the server.
+    gc.freeze()
+    gc.enable()
+    server.log.info(f"📊 master {os.getpid()}: {format_memory(memory_usage())}")
+
+
+def pre_fork(server, worker):
+    # Whatever the master allocated since (respawning workers later on) joins it
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    worker.log.info(f"📊 worker {worker.pid} booted: {format_memory(memory_usage())}")
+
+
+def post_request(worker, req, environ, resp):
+    if MEMORY_REPORT_EVERY and worker.nr and worker.nr % MEMORY_REPORT_EVERY == 0:
+        worker.log.info(f"📊 worker {worker.pid} after {worker.nr} requests: {format_memory(memory_usage())}")
@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'neurasky_backend.settings')
 
+# Serves the /api/events/ streams and /api/exports/ downloads (see entrypoint.sh), neither
+# scores anything, so unlike wsgi.py the ML model isn't warmed up here. It still loads
+# lazily if a prediction ever gets routed to this process.
 application = get_asgi_application()
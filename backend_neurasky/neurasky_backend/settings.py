@@ -140,6 +140,48 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Caches (see api/caching.py): 'local' is the per-worker L1, 'default' the L2 shared by all
+# workers. Redis when CACHE_REDIS_URL is set (needs the redis package), files otherwise
+if os.getenv('CACHE_REDIS_URL'):
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL'),
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', '/tmp/neurasky-cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+CACHES = {
+    'default': SHARED_CACHE,
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'neurasky-l1',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+# Seconds each cached endpoint's responses live in the shared cache (0 turns one off)
+API_CACHE_TTLS = {
+    'model_info': int(os.getenv('CACHE_TTL_MODEL_INFO', '60')),
+    'route_forecast': int(os.getenv('CACHE_TTL_ROUTE_FORECAST', '60')),
+    'analytics': int(os.getenv('CACHE_TTL_ANALYTICS', '600')),
+    'tracked_flights': int(os.getenv('CACHE_TTL_TRACKED_FLIGHTS', '300')),
+    'flight_stats': int(os.getenv('CACHE_TTL_FLIGHT_STATS', '300')),
+}
+# How long a worker waits for another one computing the same missing entry
+API_CACHE_COALESCE_WAIT = int(os.getenv('CACHE_COALESCE_WAIT', '5'))
+
+# Push stream /api/events/ (api/events.py, api/streams.py), served by the ASGI app (EVENTS_PORT in entrypoint.sh)
+# 'local' only reaches streams in the publishing process, use 'redis' once web workers/cron publish elsewhere
+EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', os.getenv('CACHE_REDIS_URL'))
+EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', 'redis' if EVENTS_REDIS_URL else 'local')
+# Seconds between keep-alive comments on idle streams (proxies drop silent connections)
+EVENTS_HEARTBEAT = int(os.getenv('EVENTS_HEARTBEAT', '25'))
+
+# Rows per query (and per CSV block / Parquet row group) of the /api/exports/ downloads
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '5000'))
+
 # This tells Django to accept requests from your Next.js app
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -154,4 +196,39 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('AWS_SES_USER')
 EMAIL_HOST_PASSWORD = os.getenv('AWS_SES_PASSWORD')
-DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'NeuraSky Alerts <noreply@neurasky.com>')
\ No newline at end of file
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'NeuraSky Alerts <noreply@neurasky.com>')
+
+# Mail queue (`manage.py send_queued_mail`, see api/mailer.py)
+# Sends per second, keep it at or below the SES account's maximum send rate
+MAIL_SEND_RATE = float(os.getenv('MAIL_SEND_RATE', 14))
+MAIL_BATCH_SIZE = int(os.getenv('MAIL_BATCH_SIZE', 100))
+MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+# First retry after this many seconds, doubling each attempt (capped at an hour)
+MAIL_RETRY_BACKOFF = int(os.getenv('MAIL_RETRY_BACKOFF', 60))
+
+# Seconds between passes of `manage.py evaluate_alerts --loop` (api/alerts.py)
+ALERT_EVALUATE_INTERVAL = float(os.getenv('ALERT_EVALUATE_INTERVAL', 60))
+
+# ML Serving
+# Precompute calculate_flight_risk over every known route/airline/time slot at model load
+ML_RISK_TABLE_MODE = os.getenv('ML_RISK_TABLE_MODE', 'False').lower() in ('true', '1')
+# Seconds between checks of the model artifacts' mtimes, a change triggers a hot reload (0 = off)
+ML_MODEL_WATCH_INTERVAL = int(os.getenv('ML_MODEL_WATCH_INTERVAL', '0'))
+# Flights scored per model call by /api/predict/batch/, bounds memory for large NDJSON requests
+ML_BATCH_CHUNK_SIZE = int(os.getenv('ML_BATCH_CHUNK_SIZE', '1000'))
+# Micro-batching of concurrent single-flight predictions (see api/micro_batcher.py).
+# 0 turns it off; it only pays off with several request threads per worker (GUNICORN_THREADS)
+ML_MICROBATCH_WINDOW_MS = float(os.getenv('ML_MICROBATCH_WINDOW_MS', '0'))
+ML_MICROBATCH_MAX_ROWS = int(os.getenv('ML_MICROBATCH_MAX_ROWS', '64'))
+ML_MICROBATCH_QUEUE_DEPTH = int(os.getenv('ML_MICROBATCH_QUEUE_DEPTH', '256'))
+# Out-of-process scoring pool (manage.py run_inference_pool). Empty scores inside the web workers.
+# A unix socket path, or host:port on localhost
+ML_INFERENCE_SOCKET = os.getenv('ML_INFERENCE_SOCKET', '')
+# Past this the web worker answers with a degraded (risk table / heuristic) estimate
+ML_INFERENCE_DEADLINE_MS = int(os.getenv('ML_INFERENCE_DEADLINE_MS', '250'))
+ML_INFERENCE_PROCESSES = int(os.getenv('ML_INFERENCE_PROCESSES', '2'))
+ML_INFERENCE_MAX_PENDING = int(os.getenv('ML_INFERENCE_MAX_PENDING', '32'))
+# In-process LRU of calculate_flight_risk results per (model version, route, airline, month,
+# weekday, hour). 0 entries turns it off
+ML_PREDICTION_CACHE_SIZE = int(os.getenv('ML_PREDICTION_CACHE_SIZE', '10000'))
+ML_PREDICTION_CACHE_TTL = int(os.getenv('ML_PREDICTION_CACHE_TTL', '3600'))
@@ -11,3 +11,12 @@ DATABASES = {
 
 # Disable email sending for tests
 EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# Stand-in for the shared L2 cache, separate from the per-worker L1
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'neurasky-l2-test'},
+    'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'neurasky-l1-test'},
+}
+
+# Streams and publishers share the test process
+EVENTS_BACKEND = 'local'
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'neurasky_backend.settings')
 
 application = get_wsgi_application()
+
+# Model artifacts load lazily, serving processes load them up front instead of on the first request
+from api.ml_utils import warm_up
+warm_up()
@@ -6,13 +6,16 @@ from sklearn.preprocessing import OrdinalEncoder
 from sklearn.metrics import (accuracy_score, precision_score, recall_score, f1_score, 
                            confusion_matrix, classification_report, roc_auc_score, roc_curve)
 from sklearn.utils.class_weight import compute_class_weight
-import joblib
 import os
 import glob
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 
+from api.model_bundle import BUNDLE_FILENAME, write_bundle, vocabularies_from_encoder
+
+BUNDLE_PATH = os.path.join('api', BUNDLE_FILENAME)
+
 print("🚀 Starting Enhanced ML Model Training for Flight Delay Prediction")
 print("=" * 60)
 
@@ -244,24 +247,9 @@ print("   Top 10 Features:")
 for i, row in feature_importance.head(10).iterrows():
     print(f"   {row['feature']:<20}: {row['importance']:.4f}")
 
-# 15. Save Model and Encoder
-print("\n💾 Saving model and encoder...")
-MODEL_PATH = 'api/flight_delay_model.joblib'
-ENCODER_PATH = 'api/flight_data_encoder.joblib'
-FEATURES_PATH = 'api/model_features.joblib'
-
-# Ensure api directory exists
-os.makedirs('api', exist_ok=True)
-
-joblib.dump(model, MODEL_PATH)
-joblib.dump(encoder, ENCODER_PATH)
-joblib.dump(feature_names, FEATURES_PATH)
-
-print(f"✅ Model saved to {MODEL_PATH}")
-print(f"✅ Encoder saved to {ENCODER_PATH}")
-print(f"✅ Features saved to {FEATURES_PATH}")
-
-# 16. Save training metrics
+# 15. Save Model, Encoder vocabularies and Training metrics
+# One checksummed bundle, written atomically so the API never loads a half-saved model
+print("\n💾 Saving model bundle...")
 metrics = {
     'accuracy': accuracy,
     'precision': precision,
@@ -278,10 +266,10 @@ metrics = {
     }
 }
 
-joblib.dump(metrics, 'api/training_metrics.joblib')
-print(f"✅ Training metrics saved to api/training_metrics.joblib")
+manifest = write_bundle(BUNDLE_PATH, model.booster_, feature_names, vocabularies_from_encoder(encoder), metrics)
+print(f"✅ Model bundle saved to {BUNDLE_PATH} (version {manifest['model_version']})")
 
-# 17. Save current metrics to text file for easy viewing
+# 16. Save current metrics to text file for easy viewing
 with open('api/model_metrics.txt', 'w') as f:
     f.write("FLIGHT DELAY PREDICTION MODEL METRICS\n")
     f.write("=" * 50 + "\n\n")
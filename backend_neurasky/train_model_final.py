@@ -6,13 +6,16 @@ from sklearn.preprocessing import OrdinalEncoder
 from sklearn.metrics import (accuracy_score, precision_score, recall_score, f1_score, 
                            confusion_matrix, classification_report, roc_auc_score, roc_curve)
 from sklearn.utils.class_weight import compute_class_weight
-import joblib
 import os
 import glob
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 
+from api.model_bundle import BUNDLE_FILENAME, write_bundle, vocabularies_from_encoder
+
+BUNDLE_PATH = os.path.join('api', BUNDLE_FILENAME)
+
 print("🚀 Starting Final ML Model Training (Aligned with API)")
 print("=" * 60)
 
@@ -167,11 +170,19 @@ print(f"🎯 Recall:    {recall:.4f}")
 print(f"🎯 F1-Score:  {f1:.4f}")
 
 # 11. Save Artifacts
-print("\n💾 Saving artifacts...")
-os.makedirs('api', exist_ok=True)
-joblib.dump(model, 'api/flight_delay_model.joblib')
-joblib.dump(encoder, 'api/flight_data_encoder.joblib')
-joblib.dump(feature_names, 'api/model_features.joblib')
+# One checksummed bundle, written atomically so the API never loads a half-saved model
+print("\n💾 Saving model bundle...")
+metrics = {
+    'accuracy': accuracy,
+    'precision': precision,
+    'recall': recall,
+    'f1_score': f1,
+    'roc_auc': roc_auc,
+    'training_date': datetime.now().isoformat(),
+    'dataset_size': len(df_clean),
+}
+manifest = write_bundle(BUNDLE_PATH, model.booster_, feature_names, vocabularies_from_encoder(encoder), metrics)
+print(f"✅ Model bundle saved to {BUNDLE_PATH} (version {manifest['model_version']})")
 
 # Save metrics text
 with open('api/model_metrics.txt', 'w') as f: